@@ -11,6 +11,10 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from kombu import Queue
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -132,6 +136,107 @@ STATIC_URL = '/static/'
 
 CELERY_BROKER_URL = "pyamqp://"
 
+# Solutions sent by users are judged on JUDGE_QUEUE, rejudges of whole problems on JUDGE_REJUDGE_QUEUE, so that each
+# can be served by its own workers (see bin/celery). Both may name the same queue, in which case messages' priorities
+# still put sent solutions first.
+JUDGE_QUEUE = os.environ.get("JUDGE_QUEUE", "judge")
+JUDGE_REJUDGE_QUEUE = os.environ.get("JUDGE_REJUDGE_QUEUE", "rejudge")
+JUDGE_PRIORITY = 9
+JUDGE_REJUDGE_PRIORITY = 0
+# Sending solutions is refused with 429 Too Many Requests when a user has sent this many within the last minute, has
+# this many solutions of other problems waiting to be judged, or when this many messages are waiting in JUDGE_QUEUE.
+# 0 disables a limit. The queue depth is checked at most every JUDGE_QUEUE_DEPTH_CACHE_TIME seconds.
+JUDGE_USER_SOLUTIONS_PER_MINUTE = int(os.environ.get("JUDGE_USER_SOLUTIONS_PER_MINUTE", 6))
+JUDGE_USER_ACTIVE_SOLUTIONS = int(os.environ.get("JUDGE_USER_ACTIVE_SOLUTIONS", 3))
+JUDGE_QUEUE_DEPTH_LIMIT = int(os.environ.get("JUDGE_QUEUE_DEPTH_LIMIT", 1000))
+JUDGE_QUEUE_DEPTH_CACHE_TIME = 5
+# Seconds after which users are told to try again when the queue is full.
+JUDGE_QUEUE_RETRY_AFTER = int(os.environ.get("JUDGE_QUEUE_RETRY_AFTER", 30))
+# Seconds to wait after test cases have changed before rejudging, so that a series of edits causes a single rejudge.
+JUDGE_REJUDGE_DELAY = float(os.environ.get("JUDGE_REJUDGE_DELAY", 30))
+
+CELERY_TASK_QUEUES = [
+    Queue(name, routing_key=name, queue_arguments={"x-max-priority": JUDGE_PRIORITY})
+    for name in dict.fromkeys([JUDGE_QUEUE, JUDGE_REJUDGE_QUEUE])
+]
+CELERY_TASK_DEFAULT_QUEUE = JUDGE_QUEUE
+CELERY_TASK_DEFAULT_PRIORITY = JUDGE_PRIORITY
+# Workers only reserve as many tasks as they run, so that higher priority messages are not stuck behind prefetched
+# ones.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Judge settings
+
+# Number of test cases of a single solution that are run at the same time.
+JUDGE_TEST_CONCURRENCY = int(os.environ.get("JUDGE_TEST_CONCURRENCY", os.cpu_count() or 1))
+
+# Number of test cases run by a single task. A solution's batches are spread over all workers.
+JUDGE_RUN_BATCH_SIZE = int(os.environ.get("JUDGE_RUN_BATCH_SIZE", 10))
+
+# Test cases run at the same time by all workers on a machine are limited to this many CPUs and this much memory in
+# total, counting each test case's memory limit. Others wait until enough has been freed. All workers on the machine
+# have to use the same JUDGE_ADMISSION_LEDGER file and see each other's process ids, so worker containers need a
+# shared volume and the host's PID namespace (see docker-compose.yaml). Otherwise each has the whole budget to itself.
+JUDGE_ADMISSION_CPUS = int(os.environ.get("JUDGE_ADMISSION_CPUS", os.cpu_count() or 1))
+JUDGE_ADMISSION_MEMORY = int(
+    os.environ.get("JUDGE_ADMISSION_MEMORY", os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") * 3 // 4)
+)
+JUDGE_ADMISSION_LEDGER = os.environ.get(
+    "JUDGE_ADMISSION_LEDGER", os.path.join(tempfile.gettempdir(), "sztos", "admission.json")
+)
+
+# Results of a solution's test runs are written in batches, at most this often (in seconds). 0 writes them all at once
+# after the last test case has finished.
+JUDGE_PROGRESS_FLUSH_INTERVAL = float(os.environ.get("JUDGE_PROGRESS_FLUSH_INTERVAL", 2))
+
+# Worker-local cache of compiled solutions, keyed by a hash of the sources and the compiler setup.
+JUDGE_BUILD_CACHE_DIR = os.environ.get("JUDGE_BUILD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sztos", "builds"))
+JUDGE_BUILD_CACHE_SIZE = int(os.environ.get("JUDGE_BUILD_CACHE_SIZE", 512 * 1024 * 1024))
+
+# Worker-local cache of solutions' sources, keyed by solution uuid.
+JUDGE_SOURCE_CACHE_DIR = os.environ.get(
+    "JUDGE_SOURCE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sztos", "sources")
+)
+JUDGE_SOURCE_CACHE_SIZE = int(os.environ.get("JUDGE_SOURCE_CACHE_SIZE", 256 * 1024 * 1024))
+
+# Test inputs and outputs larger than this many bytes are stored in S3_TESTDATA_BUCKET instead of the database, and
+# cached by workers.
+JUDGE_TESTDATA_INLINE_LIMIT = int(os.environ.get("JUDGE_TESTDATA_INLINE_LIMIT", 64 * 1024))
+JUDGE_TESTDATA_CACHE_DIR = os.environ.get(
+    "JUDGE_TESTDATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sztos", "testdata")
+)
+JUDGE_TESTDATA_CACHE_SIZE = int(os.environ.get("JUDGE_TESTDATA_CACHE_SIZE", 1024 * 1024 * 1024))
+
+# Maximum number of bytes a program may write to each of stdout and stderr before it is killed.
+JUDGE_OUTPUT_LIMIT = int(os.environ.get("JUDGE_OUTPUT_LIMIT", 16 * 1024 * 1024))
+
+# Path of a cgroup v2 delegated to the worker, e.g. /sys/fs/cgroup/sztos. When set, every sandbox runs in its own
+# child cgroup with memory.max, pids.max and cpu.max applied. Otherwise only RLIMIT_DATA is set through setrlimit.
+JUDGE_CGROUP_ROOT = os.environ.get("JUDGE_CGROUP_ROOT")
+JUDGE_CGROUP_PIDS_LIMIT = int(os.environ.get("JUDGE_CGROUP_PIDS_LIMIT", 64))
+# Number of CPUs a single sandbox may use.
+JUDGE_CGROUP_CPU_LIMIT = float(os.environ.get("JUDGE_CGROUP_CPU_LIMIT", 1))
+
+# Set up one sandbox per solution and execute every test case inside it, instead of starting bwrap for each test case.
+JUDGE_SANDBOX_SESSIONS = os.environ.get("JUDGE_SANDBOX_SESSIONS", "") == "1"
+
+# Run Python test cases in children forked from a pre-initialised interpreter instead of starting a new one each time.
+# Implies a sandbox session for Python solutions.
+JUDGE_PYTHON_FORK_SERVER = os.environ.get("JUDGE_PYTHON_FORK_SERVER", "") == "1"
+
+# Executions in a sandbox session are limited with setrlimit only, which would silently drop the cgroup limits.
+if JUDGE_CGROUP_ROOT and (JUDGE_SANDBOX_SESSIONS or JUDGE_PYTHON_FORK_SERVER):
+    raise ImproperlyConfigured(
+        "JUDGE_CGROUP_ROOT cannot be combined with JUDGE_SANDBOX_SESSIONS or JUDGE_PYTHON_FORK_SERVER."
+    )
+
+# Storage settings
+
+# judge.storage.MinioStorage stores objects in S3, configured below. judge.storage.FileSystemStorage stores them as
+# files below FILE_STORAGE_ROOT, for deployments on a single machine.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "judge.storage.MinioStorage")
+FILE_STORAGE_ROOT = os.environ.get("FILE_STORAGE_ROOT", os.path.join(BASE_DIR, "storage"))
+
 # S3 settings
 
 if os.environ.get("IN_CONTAINER"):
@@ -142,7 +247,23 @@ else:
 S3_ACCESS_KEY = "minioadmin"
 S3_SECRET_KEY = "minioadmin"
 
+# Maximum number of connections to S3 per process, which is also the number of objects fetched at the same time.
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 16))
+
 S3_SUBMISSION_BUCKET = "submissions"
+# How new solutions are stored in S3_SUBMISSION_BUCKET: "archive" puts all of a solution's files in one object,
+# "blobs" stores every distinct file content once, shared by all solutions. Only archives are downloaded straight from
+# local files, so deployments with judge.storage.FileSystemStorage keep using them by default.
+SOLUTION_STORAGE = os.environ.get(
+    "SOLUTION_STORAGE", "archive" if STORAGE_BACKEND == "judge.storage.FileSystemStorage" else "blobs"
+)
+# Seconds a blob that no solution refers to is kept before `manage.py collect_blobs` removes it.
+SOLUTION_BLOB_GRACE_PERIOD = int(os.environ.get("SOLUTION_BLOB_GRACE_PERIOD", 24 * 60 * 60))
+S3_TESTDATA_BUCKET = "testdata"
+S3_ARTIFACT_BUCKET = "artifacts"
+# Seconds after which `manage.py collect_artifacts` removes a compiled solution from S3_ARTIFACT_BUCKET. Artifacts are
+# only needed while a solution's test cases are run, a missing one is compiled again.
+S3_ARTIFACT_MAX_AGE = int(os.environ.get("S3_ARTIFACT_MAX_AGE", 24 * 60 * 60))
 
 # Login settings
 
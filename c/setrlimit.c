@@ -1,38 +1,88 @@
+#include <errno.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <sys/resource.h>
 #include <unistd.h>
 
-#define LIMIT RLIMIT_DATA
+static int parse_limit(const char *value, rlim_t *limit) {
+  char *end;
+  errno = 0;
+  unsigned long long parsed = strtoull(value, &end, 10);
 
-int main(int argc, char **argv) {
-  if (argc < 3) {
-    printf("Usage: %s MEMORY_LIMIT PROGRAM [ARGUMENT]...\n", argv[0]);
-    return 1;
+  if (errno != 0 || *end != '\0' || parsed == 0) {
+    return -1;
   }
 
-  rlim_t requested_limit = atoi(argv[1]);
-
-  if (requested_limit == 0) {
-    printf("Invalid MEMORY_LIMIT: %lu\n", requested_limit);
-    return 1;
-  }
+  *limit = parsed;
+  return 0;
+}
 
+static int set_limit(int resource, rlim_t requested_limit, int hard) {
   struct rlimit limit;
-  getrlimit(LIMIT, &limit);
+  getrlimit(resource, &limit);
 
   if (requested_limit > limit.rlim_max) {
     printf("Cannot set a limit higher than the hard limit: %lu\n", limit.rlim_max);
-    return 1;
+    return -1;
   }
 
   limit.rlim_cur = requested_limit;
-  if (setrlimit(LIMIT, &limit) != 0) {
+  if (hard) {
+    limit.rlim_max = requested_limit;
+  }
+
+  if (setrlimit(resource, &limit) != 0) {
     perror("setrlimit failed");
+    return -1;
+  }
+
+  return 0;
+}
+
+static int usage(const char *name) {
+  printf("Usage: %s [-m MEMORY_LIMIT] [-t CPU_SECONDS] PROGRAM [ARGUMENT]...\n", name);
+  return 1;
+}
+
+int main(int argc, char **argv) {
+  rlim_t memory_limit = 0;
+  rlim_t cpu_limit = 0;
+  int option;
+
+  // "+" stops at the first non-option, so that the program's own options are left alone
+  while ((option = getopt(argc, argv, "+m:t:")) != -1) {
+    switch (option) {
+    case 'm':
+      if (parse_limit(optarg, &memory_limit) != 0) {
+        printf("Invalid MEMORY_LIMIT: %s\n", optarg);
+        return 1;
+      }
+      break;
+    case 't':
+      if (parse_limit(optarg, &cpu_limit) != 0) {
+        printf("Invalid CPU_SECONDS: %s\n", optarg);
+        return 1;
+      }
+      break;
+    default:
+      return usage(argv[0]);
+    }
+  }
+
+  if (optind >= argc) {
+    return usage(argv[0]);
+  }
+
+  if (memory_limit && set_limit(RLIMIT_DATA, memory_limit, 0) != 0) {
+    return 1;
+  }
+
+  // The program is killed once it has used this much CPU time
+  if (cpu_limit && set_limit(RLIMIT_CPU, cpu_limit, 1) != 0) {
     return 1;
   }
 
-  execvp(argv[2], argv + 2);
+  execvp(argv[optind], argv + optind);
 
   // execvp only returns if it fails to replace the process
   perror("execvp failed");
@@ -0,0 +1,71 @@
+"""
+Solutions are stored as a single ZIP archive of their source files. A small JSON manifest describing the solution is
+kept in the archive comment, so that the entries of the archive are exactly the sources and it can be downloaded as is.
+"""
+import json
+from io import BytesIO
+from typing import Dict, List, Any, Iterable, Iterator, Tuple
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from django.core.files import File
+
+MANIFEST_VERSION = 1
+
+
+def pack(files: List[File], manifest: Dict[str, Any]) -> bytes:
+    data = BytesIO()
+    with ZipFile(data, "w", ZIP_DEFLATED) as archive:
+        for file in sorted(files, key=lambda file: file.name):
+            with archive.open(file.name, "w") as entry:
+                for chunk in file.chunks():
+                    entry.write(chunk)
+
+            file.seek(0)
+
+        archive.comment = json.dumps({"version": MANIFEST_VERSION, **manifest}).encode("utf-8")
+
+    return data.getvalue()
+
+
+class _StreamBuffer:
+    """
+    Output of a ZipFile that is drained after every entry. As it is not seekable, ZipFile writes entries with data
+    descriptors instead of going back to update their headers.
+    """
+    _chunks: List[bytes]
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream(entries: Iterable[Tuple[str, str]]) -> Iterator[bytes]:
+    """Yields a ZIP archive of the (name, content) entries piece by piece, while the entries are being produced."""
+    buffer = _StreamBuffer()
+    with ZipFile(buffer, "w", ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+def unpack(data: bytes) -> Dict[str, str]:
+    with ZipFile(BytesIO(data)) as archive:
+        return {name: archive.read(name).decode("utf-8") for name in archive.namelist()}
+
+
+def read_manifest(data: bytes) -> Dict[str, Any]:
+    with ZipFile(BytesIO(data)) as archive:
+        return json.loads(archive.comment.decode("utf-8"))
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+from tempfile import mkstemp
+from typing import BinaryIO, Callable, Optional
+
+
+class DiskCache:
+    """
+    A worker-local directory of immutable entries with a total size limit. Entries are evicted in least recently used
+    order. Writes are atomic, so a single directory can be shared by all worker processes on a machine.
+    """
+    _directory: Path
+    _max_size: int
+
+    def __init__(self, directory: str, max_size: int):
+        self._directory = Path(directory)
+        self._max_size = max_size
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        path = self._directory.joinpath(key)
+        try:
+            entry = path.open("rb")
+        except FileNotFoundError:
+            return None
+
+        # The modification time is used as the last access time, as atime is often disabled.
+        os.utime(entry.fileno())
+        return entry
+
+    def put(self, key: str, write: Callable[[Path], None]) -> None:
+        fd, temporary = mkstemp(dir=self._directory, prefix=".")
+        os.close(fd)
+        try:
+            write(Path(temporary))
+            os.replace(temporary, self._directory.joinpath(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.startswith("."):
+                continue
+
+            try:
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self._max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+            size -= entry_size
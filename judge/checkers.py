@@ -0,0 +1,147 @@
+"""
+Checkers decide whether a program's output matches the expected output of a test case. Both are read incrementally
+from binary streams, and reading stops at the first difference, so large outputs are never held in memory as a whole.
+"""
+from functools import partial
+from itertools import dropwhile, zip_longest
+from typing import BinaryIO, Callable, Iterator
+
+from .models import TestCase
+
+Checker = Callable[[BinaryIO, BinaryIO], bool]
+
+_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class _Reader:
+    _stream: BinaryIO
+    _buffer: bytes
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._buffer = b""
+
+    def peek(self) -> bytes:
+        if not self._buffer:
+            self._buffer = self._stream.read(_CHUNK_SIZE)
+
+        return self._buffer
+
+    def consume(self, size: int) -> None:
+        self._buffer = self._buffer[size:]
+
+    def skip_whitespace(self) -> None:
+        while self.peek():
+            self._buffer = self._buffer.lstrip(_WHITESPACE)
+            if self._buffer:
+                return
+
+    def only_whitespace_left(self) -> bool:
+        self.skip_whitespace()
+        return not self.peek()
+
+    def tokens(self) -> Iterator[bytes]:
+        partial_token = b""
+        while self.peek():
+            chunk = partial_token + self._buffer
+            self._buffer = b""
+
+            tokens = chunk.split()
+            # A token at the very end of the chunk may continue in the next one.
+            partial_token = tokens.pop() if tokens and chunk[-1] not in _WHITESPACE else b""
+            yield from tokens
+
+        if partial_token:
+            yield partial_token
+
+
+def exact(output: BinaryIO, expected: BinaryIO) -> bool:
+    """The outputs have to be identical, apart from leading and trailing whitespace."""
+    output_reader = _Reader(output)
+    expected_reader = _Reader(expected)
+    output_reader.skip_whitespace()
+    expected_reader.skip_whitespace()
+
+    while output_reader.peek() and expected_reader.peek():
+        output_chunk = output_reader.peek()
+        expected_chunk = expected_reader.peek()
+        size = min(len(output_chunk), len(expected_chunk))
+
+        if output_chunk[:size] != expected_chunk[:size]:
+            size = next(i for i, (a, b) in enumerate(zip(output_chunk, expected_chunk)) if a != b)
+            output_reader.consume(size)
+            expected_reader.consume(size)
+            break
+
+        output_reader.consume(size)
+        expected_reader.consume(size)
+
+    # Past the first difference, the outputs are only equal if all that is left of both is trailing whitespace.
+    return output_reader.only_whitespace_left() and expected_reader.only_whitespace_left()
+
+
+def tokens(output: BinaryIO, expected: BinaryIO) -> bool:
+    """The outputs have to consist of the same whitespace separated tokens, regardless of the whitespace itself."""
+    for output_token, expected_token in zip_longest(_Reader(output).tokens(), _Reader(expected).tokens()):
+        if output_token != expected_token:
+            return False
+
+    return True
+
+
+def lines(output: BinaryIO, expected: BinaryIO) -> bool:
+    """
+    The outputs have to consist of the same lines, but the amount and kind of whitespace within a line does not
+    matter. Leading and trailing blank lines are ignored, like leading and trailing whitespace by exact.
+    """
+    def non_blank_start(stream: BinaryIO) -> Iterator[bytes]:
+        return dropwhile(lambda line: not line.split(), iter(stream.readline, b""))
+
+    # Blank lines left over at the end of the longer output compare equal to the missing lines of the shorter one.
+    for output_line, expected_line in zip_longest(non_blank_start(output), non_blank_start(expected)):
+        output_tokens = output_line.split() if output_line is not None else []
+        expected_tokens = expected_line.split() if expected_line is not None else []
+
+        if output_tokens != expected_tokens:
+            return False
+
+    return True
+
+
+def floats(output: BinaryIO, expected: BinaryIO, tolerance: float) -> bool:
+    """
+    Like tokens, but numeric tokens only have to be within an absolute or relative difference of tolerance of the
+    expected value.
+    """
+    for output_token, expected_token in zip_longest(_Reader(output).tokens(), _Reader(expected).tokens()):
+        if output_token == expected_token:
+            continue
+
+        if output_token is None or expected_token is None:
+            return False
+
+        try:
+            output_value = float(output_token)
+            expected_value = float(expected_token)
+        except ValueError:
+            return False
+
+        difference = abs(output_value - expected_value)
+        if not (difference <= tolerance or difference <= tolerance * abs(expected_value)):
+            return False
+
+    return True
+
+
+def for_test_case(test_case: TestCase) -> Checker:
+    if test_case.checker == TestCase.Checker.EXACT:
+        return exact
+    elif test_case.checker == TestCase.Checker.TOKENS:
+        return tokens
+    elif test_case.checker == TestCase.Checker.WHITESPACE:
+        return lines
+    elif test_case.checker == TestCase.Checker.FLOAT:
+        return partial(floats, tolerance=test_case.tolerance)
+
+    raise ValueError(f"No checker for: {test_case.checker}")
@@ -0,0 +1,87 @@
+"""
+Admission control for sandbox executions on one machine. Every execution declares the memory it may use, and holds one
+CPU slot while it runs. Executions that do not fit in the free slots and memory wait in first come, first served order.
+
+The ledger of running and waiting executions is a JSON file locked with flock(), so that it is shared by all threads and
+worker processes on the machine. Entries of processes that have died are dropped.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from time import sleep
+from typing import Iterator, Dict, Any
+from uuid import uuid4
+
+from django.conf import settings
+
+_POLL_INTERVAL = 0.02
+
+
+@contextmanager
+def admit(memory: int) -> Iterator[None]:
+    """Waits until an execution using up to memory bytes fits on this machine, and holds its resources meanwhile."""
+    token = uuid4().hex
+    try:
+        with _ledger() as ledger:
+            ledger["waiting"].append([token, os.getpid(), memory])
+
+        while not _try_admit(token):
+            sleep(_POLL_INTERVAL)
+
+        yield
+    finally:
+        with _ledger() as ledger:
+            ledger["running"].pop(token, None)
+            ledger["waiting"] = [entry for entry in ledger["waiting"] if entry[0] != token]
+
+
+def _try_admit(token: str) -> bool:
+    with _ledger() as ledger:
+        head, pid, memory = ledger["waiting"][0]
+        if head != token:
+            return False
+
+        running = ledger["running"].values()
+        used_memory = sum(entry_memory for _, entry_memory in running)
+        fits = len(running) < settings.JUDGE_ADMISSION_CPUS and used_memory + memory <= settings.JUDGE_ADMISSION_MEMORY
+
+        # An execution declaring more memory than the machine has is still run, but on its own.
+        if not running or fits:
+            ledger["waiting"].pop(0)
+            ledger["running"][token] = [pid, memory]
+            return True
+
+        return False
+
+
+@contextmanager
+def _ledger() -> Iterator[Dict[str, Any]]:
+    path = Path(settings.JUDGE_ADMISSION_LEDGER)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), "r+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        content = file.read()
+        ledger = json.loads(content) if content else {"running": {}, "waiting": []}
+
+        ledger["running"] = {token: entry for token, entry in ledger["running"].items() if _alive(entry[0])}
+        ledger["waiting"] = [entry for entry in ledger["waiting"] if _alive(entry[1])]
+
+        yield ledger
+
+        file.seek(0)
+        file.truncate()
+        file.write(json.dumps(ledger))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
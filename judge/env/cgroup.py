@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+from signal import SIGKILL
+from time import sleep
+from typing import List, Optional
+from uuid import uuid4
+
+_CPU_PERIOD = 100000
+
+
+class CGroup:
+    """
+    A transient cgroup v2 that holds a single sandbox. It is created below `root`, which has to be a cgroup delegated
+    to the worker's user that contains no processes, so that the memory, pids and cpu controllers can be enabled for
+    its children.
+    """
+    path: Path
+
+    def __init__(self, root: str, memory_limit: Optional[int], pids_limit: Optional[int], cpu_limit: Optional[float]):
+        try:
+            Path(root, "cgroup.subtree_control").write_text("+memory +pids +cpu")
+        except OSError:
+            # Controllers are already enabled, or only some of them are available. Missing ones are reported below.
+            pass
+
+        self.path = Path(root, f"sandbox-{uuid4().hex}")
+        self.path.mkdir()
+
+        if memory_limit:
+            self._write("memory.max", str(memory_limit))
+            self._write("memory.swap.max", "0")
+
+        if pids_limit:
+            self._write("pids.max", str(pids_limit))
+
+        if cpu_limit:
+            self._write("cpu.max", f"{int(cpu_limit * _CPU_PERIOD)} {_CPU_PERIOD}")
+
+    def wrap(self, args: List[str]) -> List[str]:
+        """Returns a command line that moves itself into this cgroup before executing args."""
+        return ["/bin/sh", "-c", 'echo 0 > "$0" && exec "$@"', str(self.path.joinpath("cgroup.procs")), *args]
+
+    def oom_killed(self) -> bool:
+        for line in self.path.joinpath("memory.events").read_text().splitlines():
+            name, value = line.split()
+            if name == "oom_kill":
+                return int(value) > 0
+
+        return False
+
+    def peak_memory(self) -> Optional[int]:
+        # memory.peak is only available since Linux 5.19
+        try:
+            return int(self.path.joinpath("memory.peak").read_text())
+        except FileNotFoundError:
+            return None
+
+    def destroy(self) -> None:
+        kill = self.path.joinpath("cgroup.kill")
+        if kill.exists():
+            kill.write_text("1")
+        else:
+            for pid in self.path.joinpath("cgroup.procs").read_text().split():
+                try:
+                    os.kill(int(pid), SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+        # Killed processes leave the cgroup asynchronously.
+        for _ in range(100):
+            try:
+                self.path.rmdir()
+                return
+            except OSError:
+                sleep(0.01)
+
+        self.path.rmdir()
+
+    def _write(self, name: str, value: str) -> None:
+        self.path.joinpath(name).write_text(value)
@@ -1,11 +1,34 @@
+import os
+from dataclasses import replace
+from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
-from typing import Dict
+from shutil import copyfileobj, copyfile
+from subprocess import run, PIPE
+from typing import Dict, List, Optional
+
+from django.conf import settings
 
 from .runner import Runner
-from .tasks import TaskResult, Task
+from .session import SandboxSession
+from .tasks import TaskResult, Task, Stdin
+from ..cache import DiskCache
+from ..models import Solution
+from ..storage import put_object, object_exists, download_object
+
+
+@lru_cache()
+def build_cache() -> DiskCache:
+    return DiskCache(settings.JUDGE_BUILD_CACHE_DIR, settings.JUDGE_BUILD_CACHE_SIZE)
+
+
+@lru_cache()
+def compiler_version() -> bytes:
+    return run(["/usr/bin/g++", "--version"], stdout=PIPE, check=True).stdout
 
 
 class CPPRunner(Runner):
+    flags: List[str] = []
     _build_dir: Path
 
     def __init__(self):
@@ -14,30 +37,90 @@ class CPPRunner(Runner):
 
         self._build_dir.mkdir()
 
-    def compile(self, sources: Dict[str, str]) -> TaskResult:
+    def compile(self, sources: Dict[str, str]) -> Optional[TaskResult]:
+        """
+        Builds a.out, unless it is found in the worker's build cache or has been published to S3 by the worker that
+        compiled the solution first.
+        """
         super().compile(sources)
 
+        key = self._cache_key(sources)
+        if self._restore(key):
+            return None
+
         paths = (f"sources/{name}" for name in sources.keys())
 
         task = Task(
-            ["/usr/bin/g++", *paths, "-o", "/app/build/a.out"],
+            ["/usr/bin/g++", *paths, *self.flags, "-o", "/app/build/a.out"],
             cwd="/app",
             ro_binds=[("/lib", "/lib"), ("/lib64", "/lib64"), ("/usr", "/usr"), ("/bin", "/bin")],
             binds=[(self._work_dir.name, "/app")],
             unshare_all=True,
         )
 
-        return task.execute()
+        result = task.execute()
+        if result.return_code == 0:
+            executable = self._build_dir.joinpath("a.out")
+            build_cache().put(key, lambda path: copyfile(executable, path))
+            put_object(settings.S3_ARTIFACT_BUCKET, key, executable.read_bytes())
 
-    def run(self, stdin: bytes, memory_limit: int, time_limit: int):
-        task = Task(
-            ["./a.out"],
+        return result
+
+    def _restore(self, key: str) -> bool:
+        artifact = build_cache().open(key)
+        if artifact is None and object_exists(settings.S3_ARTIFACT_BUCKET, key):
+            build_cache().put(key, lambda path: download_object(settings.S3_ARTIFACT_BUCKET, key, path))
+            artifact = build_cache().open(key)
+
+        if artifact is None:
+            return False
+
+        with artifact, self._build_dir.joinpath("a.out").open("wb") as executable:
+            copyfileobj(artifact, executable)
+
+        os.chmod(self._build_dir.joinpath("a.out"), 0o755)
+        return True
+
+    def _cache_key(self, sources: Dict[str, str]) -> str:
+        digest = sha256()
+        digest.update(f"{Solution.Language.CPP.label}\0".encode("utf-8"))
+        digest.update(compiler_version())
+        for flag in self.flags:
+            digest.update(f"\0{flag}".encode("utf-8"))
+
+        for name, content in sorted(sources.items()):
+            digest.update(f"\0{name}\0{len(content)}\0{content}".encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def run(self, stdin: Stdin, memory_limit: int, time_limit: int) -> TaskResult:
+        session = self.session()
+        if session:
+            return session.execute(
+                ["./a.out"], stdin, memory_limit, time_limit, settings.JUDGE_OUTPUT_LIMIT, cwd="/app"
+            )
+
+        task = replace(
+            self._sandbox(["./a.out"]),
             stdin=stdin,
-            cwd="/app",
-            ro_binds=[("/lib", "/lib"), ("/lib64", "/lib64"), ("/usr", "/usr"), (str(self._build_dir), "/app")],
-            unshare_all=True,
             memory_limit=memory_limit,
-            time_limit=time_limit
+            time_limit=time_limit,
+            output_limit=settings.JUDGE_OUTPUT_LIMIT,
+            cgroup_root=settings.JUDGE_CGROUP_ROOT,
+            pids_limit=settings.JUDGE_CGROUP_PIDS_LIMIT,
+            cpu_limit=settings.JUDGE_CGROUP_CPU_LIMIT,
         )
 
         return task.execute()
+
+    def _start_session(self) -> Optional[SandboxSession]:
+        return SandboxSession(self._sandbox([])) if settings.JUDGE_SANDBOX_SESSIONS else None
+
+    def _sandbox(self, argv: List[str]) -> Task:
+        return Task(
+            argv,
+            cwd="/app",
+            env={"LD_LIBRARY_PATH": "/usr/local/lib"},
+            ro_binds=[("/lib", "/lib"), ("/lib64", "/lib64"), ("/usr", "/usr"), (str(self._build_dir), "/app")],
+            unshare_all=True,
+        )
@@ -1,19 +1,51 @@
+from dataclasses import replace
+from typing import List, Optional
+
+from django.conf import settings
+
 from judge.env.runner import Runner
-from judge.env.tasks import Task, TaskResult
+from judge.env.session import SandboxSession
+from judge.env.tasks import Task, TaskResult, Stdin
 
 
 class PythonRunner(Runner):
-    def run(self, stdin: bytes, memory_limit: int, time_limit: int) -> TaskResult:
+    def run(self, stdin: Stdin, memory_limit: int, time_limit: int) -> TaskResult:
         entry = "main.py" if len(self._sources) > 1 else list(self._sources.keys())[0]
 
-        task = Task(
-            ["python3", f"/app/{entry}"],
+        session = self.session()
+        if session and settings.JUDGE_PYTHON_FORK_SERVER:
+            return session.run_script(
+                f"/app/{entry}", stdin, memory_limit, time_limit, settings.JUDGE_OUTPUT_LIMIT
+            )
+
+        if session:
+            return session.execute(
+                ["python3", f"/app/{entry}"], stdin, memory_limit, time_limit, settings.JUDGE_OUTPUT_LIMIT
+            )
+
+        task = replace(
+            self._sandbox(["python3", f"/app/{entry}"]),
             stdin=stdin,
-            ro_binds=[("/lib", "/lib"), ("/lib64", "/lib64"), ("/usr", "/usr"), (str(self._source_dir), "/app")],
-            env={"LD_LIBRARY_PATH": "/usr/local/lib"},
-            unshare_all=True,
             memory_limit=memory_limit,
-            time_limit=time_limit
+            time_limit=time_limit,
+            output_limit=settings.JUDGE_OUTPUT_LIMIT,
+            cgroup_root=settings.JUDGE_CGROUP_ROOT,
+            pids_limit=settings.JUDGE_CGROUP_PIDS_LIMIT,
+            cpu_limit=settings.JUDGE_CGROUP_CPU_LIMIT,
         )
 
         return task.execute()
+
+    def _start_session(self) -> Optional[SandboxSession]:
+        if settings.JUDGE_SANDBOX_SESSIONS or settings.JUDGE_PYTHON_FORK_SERVER:
+            return SandboxSession(self._sandbox([]), preload=settings.JUDGE_PYTHON_FORK_SERVER)
+
+        return None
+
+    def _sandbox(self, argv: List[str]) -> Task:
+        return Task(
+            argv,
+            ro_binds=[("/lib", "/lib"), ("/lib64", "/lib64"), ("/usr", "/usr"), (str(self._source_dir), "/app")],
+            env={"LD_LIBRARY_PATH": "/usr/local/lib"},
+            unshare_all=True,
+        )
@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Lock
 from typing import Optional, Dict
 
-from .tasks import TaskResult
+from .session import SandboxSession
+from .tasks import TaskResult, Stdin
 from ..models import Solution
 
 
@@ -11,10 +13,13 @@ class Runner(ABC):
     _work_dir: TemporaryDirectory
     _source_dir: Path
     _sources: Dict[str, str]
+    _session: Optional[SandboxSession] = None
+    _session_lock: Lock
 
     def __init__(self):
         self._work_dir = TemporaryDirectory()
         self._source_dir = Path(self._work_dir.name, "sources")
+        self._session_lock = Lock()
 
         self._source_dir.mkdir()
 
@@ -27,10 +32,27 @@ class Runner(ABC):
         return None
 
     @abstractmethod
-    def run(self, stdin: bytes, memory_limit: int, time_limit: int) -> TaskResult:
+    def run(self, stdin: Stdin, memory_limit: int, time_limit: int) -> TaskResult:
         raise NotImplementedError()
 
+    def session(self) -> Optional[SandboxSession]:
+        """
+        Returns the sandbox session to run test cases in, which is started on first use. Returns None if sessions
+        are disabled.
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._start_session()
+
+            return self._session
+
+    def _start_session(self) -> Optional[SandboxSession]:
+        return None
+
     def clean_up(self) -> None:
+        if self._session:
+            self._session.stop()
+
         self._work_dir.cleanup()
 
     @staticmethod
@@ -0,0 +1,144 @@
+import json
+import os
+from array import array
+from dataclasses import replace
+from datetime import datetime, timedelta
+from pathlib import Path
+from socket import socketpair, socket, AF_UNIX, SOCK_SEQPACKET, SOL_SOCKET, SCM_RIGHTS
+from subprocess import Popen, DEVNULL, TimeoutExpired
+from threading import Lock
+from time import monotonic
+from typing import Optional, List
+
+from .tasks import Task, TaskResult, Stdin, communicate, wall_time_limit, file_of, data_of
+
+_MAX_REPLY_SIZE = 64 * 1024
+
+
+class SandboxSession:
+    """
+    A sandbox whose namespaces and mounts are set up once per solution. Its only process is a small server (see
+    zygote.py) that forks a supervised child for every execution, so a test case costs a fork (and an exec) instead of
+    a new bwrap. Each execution gets a fresh scratch directory on the sandbox's private /tmp as its TMPDIR, which is
+    removed once it finishes. Programs run in their own process group, which is killed when they exit, so processes
+    left running in the background do not reach into later executions.
+
+    With preload, the server imports common standard library modules up front and Python scripts are run in a forked
+    copy of the interpreter, so interpreter startup is only paid for once as well.
+
+    Memory and CPU time are limited with setrlimit in the forked child, cgroups are not supported in this mode.
+    """
+    SERVER = str(Path(__file__).with_name("zygote.py"))
+
+    _process: Popen
+    _control: socket
+    _lock: Lock
+
+    def __init__(self, sandbox: Task, preload: bool = False):
+        self._control, remote = socketpair(AF_UNIX, SOCK_SEQPACKET)
+        self._lock = Lock()
+
+        with remote:
+            task = replace(
+                sandbox,
+                argv=["python3", "/zygote.py", str(remote.fileno()), *(["--preload"] if preload else [])],
+                ro_binds=[*sandbox.ro_binds, (self.SERVER, "/zygote.py")],
+                tmpfs=[*sandbox.tmpfs, "/tmp"],
+            )
+            args = task.command()
+            print(f"Starting sandbox session: {args}")
+            self._process = Popen(args, stdin=DEVNULL, stdout=DEVNULL, env=task.env, pass_fds=(remote.fileno(),))
+
+    def execute(self, argv: List[str], stdin: Stdin, memory_limit: Optional[int], time_limit: Optional[float],
+                output_limit: Optional[int], cwd: Optional[str] = None) -> TaskResult:
+        return self._request({"argv": argv, "cwd": cwd}, stdin, memory_limit, time_limit, output_limit)
+
+    def run_script(self, path: str, stdin: Stdin, memory_limit: Optional[int], time_limit: Optional[float],
+                   output_limit: Optional[int]) -> TaskResult:
+        """Runs a Python script in a fork of the preloaded interpreter."""
+        return self._request({"path": path}, stdin, memory_limit, time_limit, output_limit)
+
+    def _request(self, request: dict, stdin: Stdin, memory_limit: Optional[int], time_limit: Optional[float],
+                 output_limit: Optional[int]) -> TaskResult:
+        # A file is sent to the program as is, other input is written to a pipe.
+        stdin_file = file_of(stdin)
+        if stdin_file:
+            stdin_read, stdin_write = stdin_file.fileno(), None
+        else:
+            stdin_read, stdin_write = os.pipe()
+
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        reply, remote = socketpair(AF_UNIX, SOCK_SEQPACKET)
+
+        wall_time = wall_time_limit(time_limit)
+        request = {
+            **request,
+            "memory_limit": memory_limit,
+            "time_limit": time_limit,
+            "wall_time_limit": wall_time,
+        }
+        fds = array("i", [stdin_read, stdout_write, stderr_write, remote.fileno()])
+
+        start_time = datetime.now()
+        try:
+            with self._lock:
+                self._control.sendmsg([json.dumps(request).encode("utf-8")], [(SOL_SOCKET, SCM_RIGHTS, fds)])
+        finally:
+            for fd in (stdout_write, stderr_write):
+                os.close(fd)
+
+            if not stdin_file:
+                os.close(stdin_read)
+
+            remote.close()
+
+        # The supervisor in the sandbox enforces the wall time limit, the deadline here only guards against a hang.
+        deadline = monotonic() + wall_time + 1 if wall_time is not None else None
+        stdout, stderr, timed_out, output_limit_exceeded = communicate(
+            open(stdin_write, "wb", buffering=0) if stdin_write is not None else None,
+            open(stdout_read, "rb", buffering=0),
+            open(stderr_read, "rb", buffering=0),
+            data_of(stdin),
+            deadline,
+            output_limit,
+        )
+
+        with reply:
+            if timed_out or output_limit_exceeded:
+                # Asks the supervisor to kill the program, like Task kills it outside a session.
+                try:
+                    reply.send(b"k")
+                except OSError:
+                    # The supervisor has replied and exited already.
+                    pass
+
+            response = reply.recv(_MAX_REPLY_SIZE)
+
+        if not response:
+            raise RuntimeError("The sandbox session exited without reporting a result.")
+
+        time = datetime.now() - start_time
+        result = json.loads(response)
+        cpu_time = timedelta(seconds=result["cpu_time"])
+
+        return TaskResult(
+            stdout=stdout,
+            stderr=stderr,
+            return_code=result["return_code"],
+            time=time,
+            cpu_time=cpu_time,
+            max_rss=result["max_rss"],
+            timed_out=(
+                timed_out or result["timed_out"] or (time_limit is not None and cpu_time.total_seconds() > time_limit)
+            ),
+            output_limit_exceeded=output_limit_exceeded,
+        )
+
+    def stop(self) -> None:
+        self._control.close()
+        try:
+            self._process.wait(1)
+        except TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
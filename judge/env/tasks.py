@@ -1,7 +1,25 @@
+import os
 from dataclasses import dataclass, field
 from datetime import timedelta, datetime
-from subprocess import Popen, PIPE, TimeoutExpired
-from typing import List, Optional, Tuple, Dict
+from resource import struct_rusage
+from select import PIPE_BUF
+from selectors import DefaultSelector, EVENT_READ, EVENT_WRITE
+from signal import SIGKILL
+from subprocess import Popen, PIPE
+from time import monotonic, sleep
+from io import UnsupportedOperation
+from typing import BinaryIO, List, Optional, Tuple, Dict, Union
+
+from .cgroup import CGroup
+
+_READ_SIZE = 64 * 1024
+
+# Input for a program: either the data itself, or a file that is passed to the program as its stdin descriptor
+Stdin = Union[bytes, BinaryIO]
+
+# time_limit is measured in CPU time. Programs that sleep or block are killed once this much wall time has passed.
+_WALL_TIME_FACTOR = 2
+_WALL_TIME_MARGIN = 1
 
 
 @dataclass
@@ -10,22 +28,34 @@ class TaskResult:
     stderr: bytes
     return_code: int
     time: timedelta
+    cpu_time: timedelta
+    max_rss: int
     timed_out: bool
+    output_limit_exceeded: bool = False
+    memory_limit_exceeded: bool = False
 
 
 @dataclass
 class Task:
     argv: List[str]
-    stdin: bytes = b""
+    stdin: Stdin = b""
     cwd: Optional[str] = None
     ro_binds: List[Tuple[str, str]] = field(default_factory=list)
     binds: List[Tuple[str, str]] = field(default_factory=list)
+    tmpfs: List[str] = field(default_factory=list)
     unshare_all: bool = False
     memory_limit: Optional[int] = None
     time_limit: Optional[float] = None
+    wall_time_limit: Optional[float] = None
+    output_limit: Optional[int] = None
     env: Optional[Dict[str, str]] = None
+    # When set, memory, pids and CPU bandwidth are limited by a transient cgroup v2 created below this path instead of
+    # setrlimit. CPU time is limited by setrlimit either way.
+    cgroup_root: Optional[str] = None
+    pids_limit: Optional[int] = None
+    cpu_limit: Optional[float] = None
 
-    def execute(self) -> TaskResult:
+    def command(self) -> List[str]:
         flags = ["--die-with-parent"]
         for src, dst in self.ro_binds:
             flags += ["--ro-bind", src, dst]
@@ -33,33 +63,211 @@ class Task:
         for src, dst in self.binds:
             flags += ["--bind", src, dst]
 
+        for path in self.tmpfs:
+            flags += ["--tmpfs", path]
+
         if self.unshare_all:
             flags.append("--unshare-all")
 
         if self.cwd:
             flags += ["--chdir", self.cwd]
 
-        args = ["/usr/bin/bwrap", *flags, *self.argv]
-        if self.memory_limit:
-            args = ["/usr/bin/setrlimit", f"{self.memory_limit}"] + args
+        return ["/usr/bin/bwrap", *flags, *self.argv]
+
+    def execute(self) -> TaskResult:
+        args = self.command()
+
+        limits = []
+        if self.memory_limit and not self.cgroup_root:
+            limits += ["-m", f"{self.memory_limit}"]
+
+        if self.time_limit:
+            # A safety net only: the CPU time is checked again against the exact limit below.
+            limits += ["-t", f"{int(self.time_limit) + 1}"]
+
+        if limits:
+            args = ["/usr/bin/setrlimit", *limits, *args]
+
+        if self.cgroup_root:
+            cgroup = CGroup(self.cgroup_root, self.memory_limit, self.pids_limit, self.cpu_limit)
+            args = cgroup.wrap(args)
+            try:
+                return self._execute(args, cgroup)
+            finally:
+                cgroup.destroy()
+
+        return self._execute(args)
 
+    def _execute(self, args: List[str], cgroup: Optional[CGroup] = None) -> TaskResult:
         print(f"Executing command: {args}")
-        child = Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE, env=self.env)
+        stdin_file = file_of(self.stdin)
+        child = Popen(args, stdin=stdin_file or PIPE, stdout=PIPE, stderr=PIPE, env=self.env)
         start_time = datetime.now()
-        try:
-            stdout, stderr = child.communicate(input=self.stdin, timeout=self.time_limit)
-            timed_out = False
-        except TimeoutExpired:
-            timed_out = True
-            stdout = b""
-            stderr = b""
+        wall_time_limit = self._wall_time_limit()
+        deadline = monotonic() + wall_time_limit if wall_time_limit is not None else None
+        stdout, stderr, timed_out, output_limit_exceeded = communicate(
+            child.stdin, child.stdout, child.stderr, data_of(self.stdin), deadline, self.output_limit
+        )
+
+        if timed_out or output_limit_exceeded:
+            self._kill(child)
+            usage = self._wait(child)
+        else:
+            usage = self._wait(child, deadline)
+            if usage is None:
+                # The program closed its output streams, but kept running past the time limit.
+                timed_out = True
+                self._kill(child)
+                usage = self._wait(child)
 
         time = datetime.now() - start_time
+        cpu_time = timedelta(seconds=usage.ru_utime + usage.ru_stime)
+        if self.time_limit is not None and cpu_time.total_seconds() > self.time_limit:
+            timed_out = True
+
+        max_rss = usage.ru_maxrss * 1024
+        memory_limit_exceeded = False
+        if cgroup:
+            max_rss = max(max_rss, cgroup.peak_memory() or 0)
+            memory_limit_exceeded = cgroup.oom_killed()
 
         return TaskResult(
             stdout=stdout,
             stderr=stderr,
             return_code=child.returncode,
             time=time,
+            cpu_time=cpu_time,
+            max_rss=max_rss,
             timed_out=timed_out,
+            output_limit_exceeded=output_limit_exceeded,
+            memory_limit_exceeded=memory_limit_exceeded,
         )
+
+    def _wall_time_limit(self) -> Optional[float]:
+        if self.wall_time_limit is not None:
+            return self.wall_time_limit
+
+        return wall_time_limit(self.time_limit)
+
+    @staticmethod
+    def _kill(child: Popen) -> None:
+        # Popen.kill() may reap an exited child through poll(), after which wait4() could not get its resource usage.
+        try:
+            os.kill(child.pid, SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def _wait(child: Popen, deadline: Optional[float] = None) -> Optional[struct_rusage]:
+        """
+        Reaps the child with wait4(), so that its resource usage (including that of every descendant it waited for)
+        is available. Returns None if the child is still running at the deadline.
+        """
+        delay = 0.0005
+        while True:
+            pid, status, usage = os.wait4(child.pid, os.WNOHANG if deadline is not None else 0)
+            if pid:
+                child.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                return usage
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+
+            delay = min(delay * 2, remaining, 0.05)
+            sleep(delay)
+
+
+def wall_time_limit(time_limit: Optional[float]) -> Optional[float]:
+    if time_limit is None:
+        return None
+
+    return time_limit * _WALL_TIME_FACTOR + _WALL_TIME_MARGIN
+
+
+def file_of(stdin: Stdin) -> Optional[BinaryIO]:
+    """Returns stdin if it is a file backed by a descriptor, which can be handed to a program without copying."""
+    if isinstance(stdin, bytes):
+        return None
+
+    try:
+        stdin.fileno()
+        return stdin
+    except UnsupportedOperation:
+        return None
+
+
+def data_of(stdin: Stdin) -> bytes:
+    """Returns the data that has to be written to a program's stdin pipe, if stdin is not a file."""
+    if isinstance(stdin, bytes):
+        return stdin
+
+    if file_of(stdin):
+        return b""
+
+    return stdin.read()
+
+
+def communicate(stdin: Optional[BinaryIO], stdout: BinaryIO, stderr: BinaryIO, data: bytes,
+                deadline: Optional[float], output_limit: Optional[int]) -> Tuple[bytes, bytes, bool, bool]:
+    """
+    Feeds data to a program's stdin pipe (if it has one) and collects its output as it is produced. Each output
+    stream is capped at output_limit bytes: reading stops as soon as the program writes more than that, and only the
+    prefix is kept. All pipes are closed on return.
+    """
+    output = {stdout: bytearray(), stderr: bytearray()}
+    remaining = memoryview(data)
+    timed_out = False
+    output_limit_exceeded = False
+
+    with DefaultSelector() as selector:
+        if stdin and remaining:
+            selector.register(stdin, EVENT_WRITE)
+        elif stdin:
+            stdin.close()
+
+        selector.register(stdout, EVENT_READ)
+        selector.register(stderr, EVENT_READ)
+
+        while selector.get_map() and not output_limit_exceeded:
+            timeout = deadline - monotonic() if deadline is not None else None
+            if timeout is not None and timeout <= 0:
+                timed_out = True
+                break
+
+            for key, _ in selector.select(timeout):
+                if key.fileobj is stdin:
+                    try:
+                        remaining = remaining[os.write(key.fd, remaining[:PIPE_BUF]):]
+                    except BrokenPipeError:
+                        # The program exited or closed its stdin without reading all of the input.
+                        remaining = remaining[:0]
+
+                    if not remaining:
+                        selector.unregister(stdin)
+                        stdin.close()
+
+                    continue
+
+                buffer = output[key.fileobj]
+                size = _READ_SIZE
+                if output_limit is not None:
+                    size = min(size, output_limit - len(buffer) + 1)
+
+                chunk = os.read(key.fd, size)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+
+                buffer += chunk
+                if output_limit is not None and len(buffer) > output_limit:
+                    del buffer[output_limit:]
+                    output_limit_exceeded = True
+                    break
+
+    for stream in (stdin, stdout, stderr):
+        if stream:
+            stream.close()
+
+    return bytes(output[stdout]), bytes(output[stderr]), timed_out, output_limit_exceeded
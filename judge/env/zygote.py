@@ -0,0 +1,201 @@
+"""
+Server executed as the only process of a sandbox session. It is started once per solution and waits for requests on
+the socket passed as its first argument. With --preload it first imports the standard library modules solutions
+commonly use, so that Python scripts can be run in a fork of this interpreter.
+
+Each request is a JSON header carrying four file descriptors: stdin, stdout and stderr for the program, and a socket
+for the reply. The header either names a Python script to run ("path") or a command line to execute ("argv"). For
+every request a supervisor process is forked. The supervisor creates a scratch directory, forks the program itself in
+its own process group, enforces the wall time limit and reports the exit status and resource usage back as JSON. Any
+message received on the reply socket before that kills the program. Once the program has exited, whatever is left of
+its process group is killed, so that processes it started in the background do not outlive it.
+
+This file is not imported by the judge, it only depends on the standard library.
+"""
+import array
+import importlib
+import json
+import os
+import resource
+import runpy
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import traceback
+
+# Imported by --preload, so that every forked program finds them in sys.modules.
+PRELOAD = [
+    "bisect", "collections", "decimal", "fractions", "functools", "heapq", "itertools", "math", "random", "re",
+    "string", "typing",
+]
+
+_MAX_HEADER_SIZE = 64 * 1024
+_FD_COUNT = 4
+
+
+def main() -> None:
+    control = socket.socket(fileno=int(sys.argv[1]))
+    if "--preload" in sys.argv[2:]:
+        for name in PRELOAD:
+            importlib.import_module(name)
+
+    # Supervisors are reaped automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        fds = array.array("i")
+        header, ancillary, _, _ = control.recvmsg(_MAX_HEADER_SIZE, socket.CMSG_SPACE(_FD_COUNT * fds.itemsize))
+        if not header:
+            return
+
+        for level, kind, data in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+        if os.fork() == 0:
+            control.close()
+            supervise(json.loads(header), *fds)
+
+        for fd in fds:
+            os.close(fd)
+
+
+def supervise(request: dict, stdin: int, stdout: int, stderr: int, reply: int) -> None:
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    scratch = tempfile.mkdtemp(prefix="run-", dir="/tmp")
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(reply)
+        execute(request, stdin, stdout, stderr, scratch)
+
+    # Also set by the program itself, whichever runs first, so that the group exists before it can be killed.
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+
+    for fd in (stdin, stdout, stderr):
+        os.close(fd)
+
+    connection = socket.socket(fileno=reply)
+    timed_out = False
+    # The program is only reaped once its group has been killed. Until then its process id, which is also the id of
+    # the group, cannot be reused by another execution's process.
+    exited = False
+    lock = threading.Lock()
+
+    def kill_group() -> None:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def kill(*_):
+        nonlocal timed_out
+        timed_out = True
+        kill_group()
+
+    def kill_on_request() -> None:
+        try:
+            connection.recv(1)
+        except OSError:
+            return
+
+        with lock:
+            if not exited:
+                kill_group()
+
+    if request.get("wall_time_limit"):
+        signal.signal(signal.SIGALRM, kill)
+        signal.setitimer(signal.ITIMER_REAL, request["wall_time_limit"])
+
+    threading.Thread(target=kill_on_request, daemon=True).start()
+
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    with lock:
+        exited = True
+        kill_group()
+
+    _, status, usage = os.wait4(pid, 0)
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    result = {
+        "return_code": -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status),
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "max_rss": usage.ru_maxrss * 1024,
+        "timed_out": timed_out,
+    }
+
+    connection.send(json.dumps(result).encode("utf-8"))
+    os._exit(0)
+
+
+def execute(request: dict, stdin: int, stdout: int, stderr: int, scratch: str) -> None:
+    os.setpgid(0, 0)
+    os.dup2(stdin, 0)
+    os.dup2(stdout, 1)
+    os.dup2(stderr, 2)
+    for fd in {stdin, stdout, stderr} - {0, 1, 2}:
+        os.close(fd)
+
+    if request.get("memory_limit"):
+        resource.setrlimit(resource.RLIMIT_DATA, (request["memory_limit"], request["memory_limit"]))
+
+    if request.get("time_limit"):
+        # A safety net only: the CPU time is checked again against the exact limit by the judge.
+        seconds = int(request["time_limit"]) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds))
+
+    os.environ["TMPDIR"] = scratch
+    os.chdir(request.get("cwd") or scratch)
+
+    if "argv" in request:
+        # Python ignores these, which would be inherited. A program writing past the output limit has to die from
+        # SIGPIPE once its output is closed, as it does outside a session.
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+        try:
+            os.execvp(request["argv"][0], request["argv"])
+        except OSError:
+            traceback.print_exc()
+            os._exit(127)
+
+    run_script(request["path"])
+
+
+def run_script(path: str) -> None:
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(path)
+    tempfile.tempdir = None
+
+    code = 0
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BrokenPipeError:
+        pass
+
+    os._exit(code)
+
+
+if __name__ == "__main__":
+    main()
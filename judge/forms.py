@@ -55,7 +55,7 @@ class SendSolutionForm(forms.Form):
         label='Send a file',
         widget=forms.ClearableFileInput(attrs={"multiple": True})
     )
-    language = forms.ChoiceField(choices=Solution.Language.choices)
+    language = forms.TypedChoiceField(choices=Solution.Language.choices, coerce=int)
 
 
 class ProblemForm(forms.ModelForm):
@@ -72,13 +72,27 @@ class ProblemForm(forms.ModelForm):
 class TestCaseForm(forms.ModelForm):
     class Meta:
         model = TestCase
-        fields = ['problem', 'input', 'expected_output', 'points', 'memory_limit', 'time_limit']
+        fields = [
+            'problem', 'input', 'expected_output', 'points', 'memory_limit', 'time_limit', 'checker', 'tolerance'
+        ]
 
     problem = forms.CharField(widget=forms.TextInput(attrs={'readonly': 'readonly'}))
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.input_is_stored():
+            self.initial['input'] = self.instance.get_input()
+        if self.instance.expected_output_is_stored():
+            self.initial['expected_output'] = self.instance.get_expected_output()
+
     def clean_problem(self):
         return self.initial['problem']
 
+    def save(self, commit=True):
+        self.instance.set_input(self.cleaned_data['input'])
+        self.instance.set_expected_output(self.cleaned_data['expected_output'])
+        return super().save(commit)
+
 
 class StudentForm(forms.ModelForm):
     class Meta:
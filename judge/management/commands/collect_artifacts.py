@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from judge.storage import list_objects_older_than, remove_objects
+
+
+class Command(BaseCommand):
+    help = "Removes compiled solutions published to the artifact bucket more than S3_ARTIFACT_MAX_AGE seconds ago."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only list the artifacts that would be removed.")
+
+    def handle(self, *args, **options):
+        expired = list_objects_older_than(settings.S3_ARTIFACT_BUCKET, "", settings.S3_ARTIFACT_MAX_AGE)
+        if not options["dry_run"]:
+            remove_objects(settings.S3_ARTIFACT_BUCKET, expired)
+
+        self.stdout.write(f"{'Would remove' if options['dry_run'] else 'Removed'} {len(expired)} artifacts.")
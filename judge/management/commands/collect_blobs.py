@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from judge.models import Solution, blob_name
+from judge.storage import list_objects_older_than, remove_objects, object_age
+
+
+class Command(BaseCommand):
+    help = "Removes blobs of solution files that no solution refers to anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only list the blobs that would be removed.")
+
+    def handle(self, *args, **options):
+        # Blobs are uploaded before their solution is saved, and refreshed when uploaded again. Only blobs older than
+        # the grace period can be unreferenced without a solution referring to them being about to be saved.
+        candidates = list_objects_older_than(
+            settings.S3_SUBMISSION_BUCKET, blob_name(""), settings.SOLUTION_BLOB_GRACE_PERIOD
+        )
+
+        referenced = set()
+        for files in Solution.objects.filter(storage=Solution.Storage.BLOBS).values_list("files", flat=True).iterator():
+            referenced.update(blob_name(digest) for digest in files.values())
+
+        removed = 0
+        for name in candidates:
+            if name in referenced:
+                continue
+
+            # Blobs refreshed for a new solution since they were listed are kept. The age is checked right before each
+            # removal, so that the window in which a refresh can be missed stays a single request long.
+            age = object_age(settings.S3_SUBMISSION_BUCKET, name)
+            if age is None or age <= settings.SOLUTION_BLOB_GRACE_PERIOD:
+                continue
+
+            if not options["dry_run"]:
+                remove_objects(settings.S3_SUBMISSION_BUCKET, [name])
+            removed += 1
+
+        self.stdout.write(f"{'Would remove' if options['dry_run'] else 'Removed'} {removed} blobs.")
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from judge.storage import backend
+
+
+class Command(BaseCommand):
+    help = "Creates the buckets of the configured storage backend that do not exist yet."
+
+    def handle(self, *args, **options):
+        for bucket in (settings.S3_SUBMISSION_BUCKET, settings.S3_TESTDATA_BUCKET, settings.S3_ARTIFACT_BUCKET):
+            backend().ensure_bucket(bucket)
+            self.stdout.write(f"{bucket}: OK")
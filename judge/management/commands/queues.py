@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from SZTOS.celery import app
+
+
+class Command(BaseCommand):
+    help = "Shows the number of waiting messages and consumers of each judge queue."
+
+    def handle(self, *args, **options):
+        with app.connection_for_read() as connection:
+            channel = connection.default_channel
+            for queue in settings.CELERY_TASK_QUEUES:
+                # A passive declaration only inspects the queue, it fails if the queue does not exist yet.
+                _, messages, consumers = channel.queue_declare(queue.name, passive=True)
+                self.stdout.write(f"{queue.name}: {messages} waiting, {consumers} consumers")
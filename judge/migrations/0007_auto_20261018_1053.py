@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0006_auto_20201108_1159'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'permissions': (('remove_user', 'Can remove user'), ('view_all_courses', 'Can view all courses'))},
+        ),
+        migrations.AlterModelOptions(
+            name='solution',
+            options={'permissions': (('view_all_solutions', 'Can view all solutions'),)},
+        ),
+        migrations.AlterField(
+            model_name='problem',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='problems', to='judge.course'),
+        ),
+        migrations.AlterField(
+            model_name='testrun',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Valid'), (1, 'Crashed'), (2, 'Invalid'), (3, 'Timed Out'), (4, 'Pending'), (5, 'Output Limit Exceeded')], default=4),
+        ),
+    ]
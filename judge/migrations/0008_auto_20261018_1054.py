@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0007_auto_20261018_1053'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testrun',
+            name='cpu_time',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='memory',
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:59
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0009_auto_20261018_1054'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcase',
+            name='checker',
+            field=models.IntegerField(choices=[(0, 'Exact'), (1, 'Tokens'), (2, 'Ignore whitespace'), (3, 'Floating point')], default=0),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='tolerance',
+            field=models.FloatField(blank=True, default=1e-06, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
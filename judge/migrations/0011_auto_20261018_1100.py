@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:00
+
+from hashlib import sha256
+
+from django.db import migrations, models
+
+
+def hash_test_data(apps, schema_editor):
+    # Existing test data stays inline, it is moved to S3 the next time a test case is saved.
+    TestCase = apps.get_model('judge', 'TestCase')
+    for test_case in TestCase.objects.all():
+        for field in ('input', 'expected_output'):
+            data = getattr(test_case, field).encode('utf-8')
+            setattr(test_case, f'{field}_hash', sha256(data).hexdigest())
+            setattr(test_case, f'{field}_size', len(data))
+
+        test_case.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0010_auto_20261018_1059'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcase',
+            name='expected_output_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='expected_output_size',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='input_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='input_size',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(hash_test_data, migrations.RunPython.noop),
+    ]
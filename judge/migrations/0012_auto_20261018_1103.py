@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+def judge_finished_solutions(apps, schema_editor):
+    # Solutions used to stay in Compilation Successful after their last test run had finished.
+    Solution = apps.get_model('judge', 'Solution')
+    TestRun = apps.get_model('judge', 'TestRun')
+    pending = TestRun.objects.filter(state=4).values('solution_id')
+    Solution.objects.filter(state=2).exclude(pk__in=pending).update(state=4)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0011_auto_20261018_1100'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='solution',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Compilation Pending'), (1, 'Compilation In Progress'), (2, 'Compilation Successful'), (3, 'Compilation Failed'), (4, 'Judged')], default=0),
+        ),
+        migrations.RunPython(judge_finished_solutions, migrations.RunPython.noop),
+    ]
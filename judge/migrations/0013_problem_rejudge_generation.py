@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0012_auto_20261018_1103'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='rejudge_generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:06
+
+from hashlib import sha256
+
+from django.db import migrations, models
+
+
+def version_test_cases(apps, schema_editor):
+    # Existing test runs are assumed to have been judged against the current test cases.
+    TestCase = apps.get_model('judge', 'TestCase')
+    TestRun = apps.get_model('judge', 'TestRun')
+    for test_case in TestCase.objects.all():
+        fields = (
+            test_case.input_hash, test_case.expected_output_hash, int(test_case.checker), float(test_case.tolerance),
+            int(test_case.memory_limit), float(test_case.time_limit),
+        )
+        test_case.version = sha256('\0'.join(str(field) for field in fields).encode('utf-8')).hexdigest()
+        test_case.save(update_fields=['version'])
+        TestRun.objects.filter(test_case=test_case).exclude(state=4).update(test_case_version=test_case.version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0013_problem_rejudge_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcase',
+            name='version',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='testrun',
+            name='test_case_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(version_test_cases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0014_auto_20261018_1106'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solution',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0015_solution_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solution',
+            name='task_id',
+            field=models.CharField(blank=True, editable=False, max_length=36),
+        ),
+        migrations.AlterField(
+            model_name='solution',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Compilation Pending'), (1, 'Compilation In Progress'), (2, 'Compilation Successful'), (3, 'Compilation Failed'), (4, 'Judged'), (5, 'Superseded')], default=0),
+        ),
+    ]
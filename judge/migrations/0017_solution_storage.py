@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0016_auto_20261018_1108'),
+    ]
+
+    # Existing solutions are stored as separate files, only new ones default to an archive.
+    operations = [
+        migrations.AddField(
+            model_name='solution',
+            name='storage',
+            field=models.IntegerField(choices=[(0, 'Separate files'), (1, 'Archive')], default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='solution',
+            name='storage',
+            field=models.IntegerField(choices=[(0, 'Separate files'), (1, 'Archive')], default=1, editable=False),
+        ),
+    ]
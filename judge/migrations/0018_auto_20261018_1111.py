@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0017_solution_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solution',
+            name='files',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='solution',
+            name='storage',
+            field=models.IntegerField(choices=[(0, 'Separate files'), (1, 'Archive'), (2, 'Blobs')], default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0018_auto_20261018_1111'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testrun',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Valid'), (1, 'Crashed'), (2, 'Invalid'), (3, 'Timed Out'), (4, 'Pending'), (5, 'Output Limit Exceeded'), (6, 'Memory Limit Exceeded'), (7, 'Judge Error')], default=4),
+        ),
+    ]
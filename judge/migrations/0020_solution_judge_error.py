@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0019_testrun_judge_error'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='solution',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Compilation Pending'), (1, 'Compilation In Progress'), (2, 'Compilation Successful'), (3, 'Compilation Failed'), (4, 'Judged'), (5, 'Superseded'), (6, 'Judge Error')], default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:34
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_test_runs(apps, schema_editor):
+    # Concurrent judging of the same solution could create several test runs of one test case. The first one is kept.
+    TestRun = apps.get_model('judge', 'TestRun')
+    runs = TestRun.objects.values('solution_id', 'test_case_id').annotate(first=Min('pk'))
+    TestRun.objects.exclude(pk__in=list(runs.values_list('first', flat=True))).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0020_solution_judge_error'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='testrun',
+            options={'ordering': ['test_case']},
+        ),
+        migrations.RunPython(delete_duplicate_test_runs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='testrun',
+            constraint=models.UniqueConstraint(fields=('solution', 'test_case'), name='unique_test_run'),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from typing import Dict, Optional
+from hashlib import sha256
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, List
 from uuid import uuid4
 
 from django.conf import settings
@@ -6,9 +8,14 @@ from django.contrib.auth.models import User
 from django.core.files import File
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Sum, Q, Subquery, Max
+from django.db.models import Sum, Q, Subquery, Max, F
 
-from judge.storage import s3, get_directory
+from judge import archive, testdata
+from judge.storage import get_directories, get_bytes, get_objects, put_object, put_objects_once, local_path
+
+
+def blob_name(digest: str) -> str:
+    return f"blobs/{digest}"
 
 
 class Course(models.Model):
@@ -30,6 +37,8 @@ class Problem(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     pub_date = models.DateTimeField('date published', auto_now_add=True)
+    # Incremented whenever the test cases change. Judging tasks started for an older generation stop early.
+    rejudge_generation = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -42,13 +51,45 @@ class Problem(models.Model):
             solution.user: solution for solution in solutions
         }
 
-    def run_all_solutions(self) -> None:
+    def run_all_solutions(self, generation: Optional[int] = None) -> None:
+        """
+        Judges the newest solution of every user against the test cases that were added or changed since it was
+        judged. Results of unchanged test cases are kept.
+        """
         newest = Subquery(self.solution_set.values("user__pk").annotate(Max("pk")).values("pk__max"))
         solutions = Solution.objects.filter(pk__in=newest).order_by("user__pk")
         for solution in solutions:
-            from judge.tasks import validate_solution
-            TestRun.objects.filter(solution=solution).delete()
-            validate_solution.delay(solution.id)
+            from judge.tasks import enqueue_solution
+            # Pending test runs have no version yet, but belong to a task that is still running them.
+            solution.test_runs.exclude(test_case_version=F("test_case__version")).exclude(
+                state=TestRun.State.PENDING
+            ).delete()
+
+            # The outcome of compilation does not depend on the test cases
+            if solution.state == Solution.State.COMPILATION_FAILED:
+                continue
+
+            # Sent solutions that have not been picked up yet are judged against the current test cases anyway
+            if solution.state == Solution.State.COMPILATION_PENDING:
+                continue
+
+            # Tasks still running the pending test runs of an earlier generation stop early, so those are run again.
+            judged = solution.state in (Solution.State.COMPILATION_SUCCESSFUL, Solution.State.JUDGED)
+            pending = solution.test_runs.filter(state=TestRun.State.PENDING).exists()
+            if judged and not pending and not solution.missing_test_cases().exists():
+                continue
+
+            enqueue_solution(solution.id, rejudge=True, generation=generation)
+
+    def schedule_rejudge(self) -> None:
+        """
+        Rejudges all solutions once the test cases have not changed for JUDGE_REJUDGE_DELAY seconds. Rejudges
+        scheduled before are skipped, and judging tasks still running for the old test cases stop early.
+        """
+        from judge.tasks import schedule_rejudge
+        Problem.objects.filter(pk=self.pk).update(rejudge_generation=F("rejudge_generation") + 1)
+        self.refresh_from_db(fields=["rejudge_generation"])
+        schedule_rejudge(self.pk, self.rejudge_generation)
 
     class Meta:
         permissions = (
@@ -57,12 +98,72 @@ class Problem(models.Model):
 
 
 class TestCase(models.Model):
+    class Checker(models.IntegerChoices):
+        EXACT = 0
+        TOKENS = 1
+        WHITESPACE = 2, "Ignore whitespace"
+        FLOAT = 3, "Floating point"
+
     problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name="test_cases")
     input = models.TextField(blank=True)
     expected_output = models.TextField()
     points = models.FloatField(default=1, validators=(MinValueValidator(0),))
     memory_limit = models.IntegerField(blank=True, default=50 * 1024 * 1024)
     time_limit = models.FloatField(validators=(MinValueValidator(0),), blank=True, default=60)
+    checker = models.IntegerField(choices=Checker.choices, default=Checker.EXACT)
+    tolerance = models.FloatField(validators=(MinValueValidator(0),), blank=True, default=1e-6)
+    # Inputs and outputs over JUDGE_TESTDATA_INLINE_LIMIT bytes are moved to S3, see judge.testdata.
+    input_hash = models.CharField(max_length=64, blank=True, editable=False)
+    input_size = models.IntegerField(default=0, editable=False)
+    expected_output_hash = models.CharField(max_length=64, blank=True, editable=False)
+    expected_output_size = models.IntegerField(default=0, editable=False)
+    # Hash of everything that affects the result of a test run, see TestRun.test_case_version.
+    version = models.CharField(max_length=64, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Data that has been moved to S3 is only replaced when new text is assigned.
+        if self.input or not self.input_is_stored():
+            self.set_input(self.input)
+
+        if self.expected_output or not self.expected_output_is_stored():
+            self.set_expected_output(self.expected_output)
+
+        self.version = self.compute_version()
+        super().save(*args, **kwargs)
+
+    def compute_version(self) -> str:
+        # Numbers are normalised, as they may have been assigned as int or float.
+        fields = (
+            self.input_hash, self.expected_output_hash, int(self.checker), float(self.tolerance),
+            int(self.memory_limit), float(self.time_limit),
+        )
+        return sha256("\0".join(str(field) for field in fields).encode("utf-8")).hexdigest()
+
+    def set_input(self, text: str) -> None:
+        self.input, self.input_hash, self.input_size = testdata.store(text)
+
+    def set_expected_output(self, text: str) -> None:
+        self.expected_output, self.expected_output_hash, self.expected_output_size = testdata.store(text)
+
+    def input_is_stored(self) -> bool:
+        return testdata.is_stored(self.input, self.input_size)
+
+    def expected_output_is_stored(self) -> bool:
+        return testdata.is_stored(self.expected_output, self.expected_output_size)
+
+    def open_input(self) -> BinaryIO:
+        return testdata.open_data(self.input, self.input_hash, self.input_size)
+
+    def open_expected_output(self) -> BinaryIO:
+        return testdata.open_data(self.expected_output, self.expected_output_hash, self.expected_output_size)
+
+    def get_input(self) -> str:
+        with self.open_input() as data:
+            return data.read().decode("utf-8")
+
+    def get_expected_output(self) -> str:
+        with self.open_expected_output() as data:
+            return data.read().decode("utf-8")
 
 
 class Solution(models.Model):
@@ -76,23 +177,144 @@ class Solution(models.Model):
         COMPILATION_IN_PROGRESS = 1
         COMPILATION_SUCCESSFUL = 2
         COMPILATION_FAILED = 3
+        JUDGED = 4
+        # A newer solution of the same user and problem was sent before this one was judged.
+        SUPERSEDED = 5
+        # The worker failed to compile the solution, e.g. because the sandbox could not be started. It is judged again
+        # on the next rejudge.
+        JUDGE_ERROR = 6
 
     class Language(models.IntegerChoices):
         CPP = 0, "C++"
         PYTHON = 1
 
+    class Storage(models.IntegerChoices):
+        # Every source file is a separate object below {uuid}/files/
+        FILES = 0, "Separate files"
+        # All source files are in one archive, see judge.archive
+        ARCHIVE = 1
+        # Every source file is stored once per content as blobs/{sha256}, see Solution.files
+        BLOBS = 2
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="solutions", default=None)
     problem = models.ForeignKey(Problem, on_delete=models.CASCADE)
     pub_date = models.DateTimeField('date published', auto_now_add=True)
     state = models.IntegerField(choices=State.choices, default=State.COMPILATION_PENDING)
     uuid = models.UUIDField(default=uuid4, editable=False)
     language = models.IntegerField(choices=Language.choices)
+    # Hash of the language and source files, identical solutions may share their results.
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    # Id of the Celery task that judges the solution, used to revoke it.
+    task_id = models.CharField(max_length=36, blank=True, editable=False)
+    storage = models.IntegerField(choices=Storage.choices, default=Storage.ARCHIVE, editable=False)
+    # Maps the names of the source files to the hashes of their blobs, for BLOBS storage.
+    files = models.JSONField(default=dict, editable=False)
+
+    @staticmethod
+    def in_flight() -> Q:
+        """
+        Matches solutions that are waiting for or being judged. Compiled solutions are only in flight while they have
+        pending test runs, finished ones are Judged.
+        """
+        pending = TestRun.objects.filter(state=TestRun.State.PENDING).values("solution_id")
+        compiling = Q(state__in=[Solution.State.COMPILATION_PENDING, Solution.State.COMPILATION_IN_PROGRESS])
+        running = Q(state=Solution.State.COMPILATION_SUCCESSFUL, pk__in=pending)
+        return compiling | running
+
+    def save_files(self, files: List[File]) -> None:
+        """Stores the source files in the format selected by SOLUTION_STORAGE."""
+        self.storage = Solution.Storage[settings.SOLUTION_STORAGE.upper()]
 
-    def save_file(self, file: File) -> None:
-        s3.put_object(settings.S3_SUBMISSION_BUCKET, f"{self.uuid}/files/{file.name}", file, file.size)
+        if self.storage == Solution.Storage.ARCHIVE:
+            manifest = {"language": self.get_language_display(), "source_hash": self.source_hash}
+            put_object(settings.S3_SUBMISSION_BUCKET, self.archive_name(), archive.pack(files, manifest))
+        elif self.storage == Solution.Storage.BLOBS:
+            blobs = {}
+            for file in files:
+                data = file.read()
+                file.seek(0)
+                self.files[file.name] = sha256(data).hexdigest()
+                blobs[blob_name(self.files[file.name])] = data
+
+            # Blobs are refreshed well before they could be collected by the collect_blobs command.
+            put_objects_once(settings.S3_SUBMISSION_BUCKET, blobs, settings.SOLUTION_BLOB_GRACE_PERIOD / 2)
+        else:
+            raise ValueError(f"Solutions cannot be saved as: {self.storage}")
+
+    def archive_name(self) -> str:
+        return f"{self.uuid}/sources.zip"
+
+    def get_archive(self) -> Optional[bytes]:
+        """Returns the ZIP archive of the sources as stored, or None if they are stored as separate files."""
+        if self.storage != Solution.Storage.ARCHIVE:
+            return None
+
+        return get_bytes(settings.S3_SUBMISSION_BUCKET, self.archive_name())
+
+    def get_archive_path(self) -> Optional[Path]:
+        """Returns the path of the ZIP archive of the sources if the storage backend keeps it as a local file."""
+        if self.storage != Solution.Storage.ARCHIVE:
+            return None
+
+        return local_path(settings.S3_SUBMISSION_BUCKET, self.archive_name())
+
+    def hash_files(self, files: List[File]) -> None:
+        digest = sha256(f"{self.language}".encode("utf-8"))
+        for file in sorted(files, key=lambda file: file.name):
+            digest.update(f"\0{file.name}\0{file.size}\0".encode("utf-8"))
+            for chunk in file.chunks():
+                digest.update(chunk)
+
+            file.seek(0)
+
+        self.source_hash = digest.hexdigest()
+
+    def find_identical(self) -> Optional["Solution"]:
+        """Returns the newest other solution with the same sources whose judging has finished."""
+        if not self.source_hash:
+            return None
+
+        return Solution.objects.filter(
+            problem_id=self.problem_id,
+            source_hash=self.source_hash,
+            state__in=[Solution.State.COMPILATION_FAILED, Solution.State.JUDGED],
+        ).exclude(pk=self.pk).order_by("-pk").first()
 
     def get_sources(self) -> Dict[str, str]:
-        return get_directory(settings.S3_SUBMISSION_BUCKET, f"{self.uuid}/files/")
+        return Solution.get_sources_of([self])[self]
+
+    @staticmethod
+    def get_sources_of(solutions: List["Solution"]) -> Dict["Solution", Dict[str, str]]:
+        """Like get_sources, but fetches the sources of all solutions at once."""
+        archived = [solution for solution in solutions if solution.storage == Solution.Storage.ARCHIVE]
+        archives = get_objects(settings.S3_SUBMISSION_BUCKET, [solution.archive_name() for solution in archived])
+        # Blobs shared by several solutions are fetched once
+        digests = {
+            digest for solution in solutions if solution.storage == Solution.Storage.BLOBS
+            for digest in solution.files.values()
+        }
+        blobs = get_objects(settings.S3_SUBMISSION_BUCKET, [blob_name(digest) for digest in digests])
+        directories = get_directories(
+            settings.S3_SUBMISSION_BUCKET,
+            [f"{solution.uuid}/files/" for solution in solutions if solution.storage == Solution.Storage.FILES],
+        )
+
+        sources = {}
+        for solution in solutions:
+            if solution.storage == Solution.Storage.ARCHIVE:
+                sources[solution] = archive.unpack(archives[solution.archive_name()])
+            elif solution.storage == Solution.Storage.BLOBS:
+                sources[solution] = {
+                    name: blobs[blob_name(digest)].decode("utf-8") for name, digest in solution.files.items()
+                }
+            else:
+                sources[solution] = directories[f"{solution.uuid}/files/"]
+
+        return sources
+
+    def missing_test_cases(self) -> "models.QuerySet[TestCase]":
+        """Returns the problem's test cases that this solution has no test run for."""
+        return TestCase.objects.filter(problem_id=self.problem_id).exclude(testrun__solution=self)
 
     def get_grade(self) -> Optional[float]:
         if self.test_runs.count() == 0:
@@ -116,12 +338,24 @@ class Solution(models.Model):
 
 
 class TestRun(models.Model):
+    class Meta:
+        # Test runs are listed in the order of their test cases, which is not the order they were created in once
+        # some of them have been rerun or copied from an identical solution.
+        ordering = ["test_case"]
+        constraints = [
+            models.UniqueConstraint(fields=["solution", "test_case"], name="unique_test_run"),
+        ]
+
     class State(models.IntegerChoices):
         VALID = 0
         CRASHED = 1
         INVALID = 2
         TIMED_OUT = 3
         PENDING = 4
+        OUTPUT_LIMIT_EXCEEDED = 5
+        MEMORY_LIMIT_EXCEEDED = 6
+        # The worker failed to run the test case, e.g. because the sandbox could not be started.
+        JUDGE_ERROR = 7
 
     test_case = models.ForeignKey(TestCase, on_delete=models.CASCADE)
     solution = models.ForeignKey(Solution, on_delete=models.DO_NOTHING, related_name="test_runs")
@@ -130,3 +364,7 @@ class TestRun(models.Model):
     return_code = models.IntegerField(null=True)
     state = models.IntegerField(choices=State.choices, default=State.PENDING)
     time = models.FloatField(null=True)
+    cpu_time = models.FloatField(null=True)
+    memory = models.IntegerField(null=True)
+    # TestCase.version that the test run was judged against. Test runs of other versions are rerun on a rejudge.
+    test_case_version = models.CharField(max_length=64, blank=True)
@@ -1,32 +1,291 @@
-from typing import Dict, Iterable
+"""
+Object storage for solutions, test data and build artifacts. Objects live in buckets and are named by paths, like in
+S3. The backend is selected by the STORAGE_BACKEND setting, and the functions of this module delegate to it.
+"""
+import calendar
+import os
+import shutil
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkstemp
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import minio
+import urllib3
 from django.conf import settings
+from django.utils.module_loading import import_string
 from minio import Minio
+from minio.error import NoSuchKey
 
-s3 = Minio(
-    settings.S3_HOST,
-    access_key=settings.S3_ACCESS_KEY,
-    secret_key=settings.S3_SECRET_KEY,
-    secure=False
-)
+
+class Storage(ABC):
+    @abstractmethod
+    def ensure_bucket(self, bucket_name: str) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_bytes(self, bucket_name: str, object_name: str) -> bytes:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def put_object(self, bucket_name: str, object_name: str, data: bytes) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def object_age(self, bucket_name: str, object_name: str) -> Optional[float]:
+        """Returns the number of seconds since the object was last written, or None if it does not exist."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def list_objects(self, bucket_name: str, prefix: str, recursive: bool = False) -> List[Tuple[str, float]]:
+        """
+        Returns the names and modification timestamps of the objects whose names start with prefix. Unless recursive,
+        objects whose names continue with a "/" after the prefix are left out.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def remove_objects(self, bucket_name: str, object_names: List[str]) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def download_object(self, bucket_name: str, object_name: str, path: Path) -> None:
+        raise NotImplementedError()
+
+    def local_path(self, bucket_name: str, object_name: str) -> Optional[Path]:
+        """Returns the path of the object if it is a local file, so that it can be served without being read."""
+        return None
+
+
+class MinioStorage(Storage):
+    """Stores objects in an S3 compatible service, configured by the S3_* settings."""
+    s3: Minio
+
+    def __init__(self):
+        self.s3 = Minio(
+            settings.S3_HOST,
+            access_key=settings.S3_ACCESS_KEY,
+            secret_key=settings.S3_SECRET_KEY,
+            secure=False,
+            # One pool shared by all threads, large enough for the concurrent requests of fetch_executor().
+            http_client=urllib3.PoolManager(
+                maxsize=settings.S3_MAX_POOL_CONNECTIONS,
+                block=True,
+                timeout=urllib3.Timeout.DEFAULT_TIMEOUT,
+                retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            ),
+        )
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        if not self.s3.bucket_exists(bucket_name):
+            self.s3.make_bucket(bucket_name)
+
+    def get_bytes(self, bucket_name: str, object_name: str) -> bytes:
+        response = None
+        try:
+            response = self.s3.get_object(bucket_name, object_name)
+            return response.data
+        finally:
+            if response:
+                response.close()
+                response.release_conn()
+
+    def put_object(self, bucket_name: str, object_name: str, data: bytes) -> None:
+        self.s3.put_object(bucket_name, object_name, BytesIO(data), len(data))
+
+    def object_age(self, bucket_name: str, object_name: str) -> Optional[float]:
+        try:
+            stat = self.s3.stat_object(bucket_name, object_name)
+        except NoSuchKey:
+            return None
+
+        return time() - calendar.timegm(stat.last_modified)
+
+    def list_objects(self, bucket_name: str, prefix: str, recursive: bool = False) -> List[Tuple[str, float]]:
+        objects: Iterable[minio.Object] = self.s3.list_objects(bucket_name, prefix, recursive=recursive)
+        return [(object.object_name, object.last_modified.timestamp()) for object in objects if not object.is_dir]
+
+    def remove_objects(self, bucket_name: str, object_names: List[str]) -> None:
+        # Objects are removed lazily while the returned errors are iterated.
+        for error in self.s3.remove_objects(bucket_name, object_names):
+            raise RuntimeError(f"Could not remove {error.object_name}: {error.error_message}")
+
+    def download_object(self, bucket_name: str, object_name: str, path: Path) -> None:
+        response = None
+        try:
+            response = self.s3.get_object(bucket_name, object_name)
+            with path.open("wb") as file:
+                for chunk in response.stream(1024 * 1024):
+                    file.write(chunk)
+        finally:
+            if response:
+                response.close()
+                response.release_conn()
+
+
+class FileSystemStorage(Storage):
+    """
+    Stores objects as files in FILE_STORAGE_ROOT/{bucket}/{name}, for deployments on a single machine. Files are
+    written atomically, so the directory may be shared by the web server and workers.
+    """
+    root: Path
+
+    def __init__(self):
+        self.root = Path(settings.FILE_STORAGE_ROOT)
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        self._path(bucket_name, "").mkdir(parents=True, exist_ok=True)
+
+    def get_bytes(self, bucket_name: str, object_name: str) -> bytes:
+        return self._path(bucket_name, object_name).read_bytes()
+
+    def put_object(self, bucket_name: str, object_name: str, data: bytes) -> None:
+        path = self._path(bucket_name, object_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, temporary = mkstemp(dir=path.parent, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def object_age(self, bucket_name: str, object_name: str) -> Optional[float]:
+        try:
+            return time() - self._path(bucket_name, object_name).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def list_objects(self, bucket_name: str, prefix: str, recursive: bool = False) -> List[Tuple[str, float]]:
+        bucket = self._path(bucket_name, "")
+        # The prefix does not have to end at a directory boundary
+        directory = self._path(bucket_name, prefix.rpartition("/")[0])
+        if not directory.is_dir():
+            return []
+
+        paths = directory.rglob("*") if recursive else directory.iterdir()
+        objects = []
+        for path in paths:
+            name = path.relative_to(bucket).as_posix()
+            if path.name.startswith(".") or not path.is_file() or not name.startswith(prefix):
+                continue
+
+            objects.append((name, path.stat().st_mtime))
+
+        return sorted(objects)
+
+    def remove_objects(self, bucket_name: str, object_names: List[str]) -> None:
+        for object_name in object_names:
+            try:
+                self._path(bucket_name, object_name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def download_object(self, bucket_name: str, object_name: str, path: Path) -> None:
+        shutil.copyfile(self._path(bucket_name, object_name), path)
+
+    def local_path(self, bucket_name: str, object_name: str) -> Optional[Path]:
+        path = self._path(bucket_name, object_name)
+        return path if path.is_file() else None
+
+    def _path(self, bucket_name: str, object_name: str) -> Path:
+        parts = [bucket_name, *object_name.split("/")]
+        if any(part in ("", ".", "..") for part in parts[:-1]) or parts[-1] in (".", ".."):
+            raise ValueError(f"Invalid object name: {bucket_name}/{object_name}")
+
+        return self.root.joinpath(*parts)
+
+
+@lru_cache()
+def backend() -> Storage:
+    return import_string(settings.STORAGE_BACKEND)()
+
+
+@lru_cache()
+def fetch_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.S3_MAX_POOL_CONNECTIONS, thread_name_prefix="s3")
 
 
 def get_object(bucket_name: str, object_name: str) -> str:
-    response = None
-    try:
-        response = s3.get_object(bucket_name, object_name)
-        return response.data.decode("utf-8")
-    finally:
-        if response:
-            response.close()
-            response.release_conn()
+    return get_bytes(bucket_name, object_name).decode("utf-8")
+
+
+def get_bytes(bucket_name: str, object_name: str) -> bytes:
+    return backend().get_bytes(bucket_name, object_name)
+
+
+def get_objects(bucket_name: str, object_names: List[str]) -> Dict[str, bytes]:
+    """Fetches all objects concurrently."""
+    return dict(zip(object_names, fetch_executor().map(lambda name: get_bytes(bucket_name, name), object_names)))
 
 
 def get_directory(bucket: str, prefix: str) -> Dict[str, str]:
-    objects: Iterable[minio.Object] = s3.list_objects(bucket, prefix)
-    files = {
-        object.object_name[len(prefix):]: get_object(object.bucket_name, object.object_name)
-        for object in objects
+    return get_directories(bucket, [prefix])[prefix]
+
+
+def get_directories(bucket: str, prefixes: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Returns the files below each of the prefixes, keyed by prefix and then by name relative to the prefix. All
+    prefixes are listed, and then all objects fetched, concurrently.
+    """
+    def list_directory(prefix: str) -> List[str]:
+        return [name for name, _ in backend().list_objects(bucket, prefix)]
+
+    listings = dict(zip(prefixes, fetch_executor().map(list_directory, prefixes)))
+    names = [name for listing in listings.values() for name in listing]
+    contents = dict(zip(names, fetch_executor().map(lambda name: get_object(bucket, name), names)))
+
+    return {
+        prefix: {name[len(prefix):]: contents[name] for name in listing}
+        for prefix, listing in listings.items()
     }
-    return files
+
+
+def put_object(bucket_name: str, object_name: str, data: bytes) -> None:
+    backend().put_object(bucket_name, object_name, data)
+
+
+def object_exists(bucket_name: str, object_name: str) -> bool:
+    return object_age(bucket_name, object_name) is not None
+
+
+def object_age(bucket_name: str, object_name: str) -> Optional[float]:
+    return backend().object_age(bucket_name, object_name)
+
+
+def put_objects_once(bucket_name: str, objects: Dict[str, bytes], refresh_after: float) -> None:
+    """
+    Concurrently uploads objects whose names identify their content, skipping ones that exist already. Existing
+    objects older than refresh_after seconds are written again, so that their age tells how long ago they were last
+    needed.
+    """
+    def put(name: str) -> None:
+        age = object_age(bucket_name, name)
+        if age is None or age > refresh_after:
+            put_object(bucket_name, name, objects[name])
+
+    list(fetch_executor().map(put, objects.keys()))
+
+
+def list_objects_older_than(bucket_name: str, prefix: str, age: float) -> List[str]:
+    cutoff = time() - age
+    return [name for name, modified in backend().list_objects(bucket_name, prefix, recursive=True) if modified < cutoff]
+
+
+def remove_objects(bucket_name: str, object_names: List[str]) -> None:
+    backend().remove_objects(bucket_name, object_names)
+
+
+def download_object(bucket_name: str, object_name: str, path: Path) -> None:
+    backend().download_object(bucket_name, object_name, path)
+
+
+def local_path(bucket_name: str, object_name: str) -> Optional[Path]:
+    return backend().local_path(bucket_name, object_name)
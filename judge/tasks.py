@@ -1,75 +1,311 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+from io import BytesIO
 from logging import Logger
+from time import monotonic
+from typing import List, Optional, Dict, Any
 
-from celery import shared_task
+from celery import shared_task, group, current_app
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import F
 
+from . import checkers
+from .cache import DiskCache
+from .env import admission
 from .env.runner import Runner
-from .models import Solution, TestRun
+from .env.tasks import TaskResult
+from .models import Problem, Solution, TestRun, TestCase
 from django.contrib.auth import get_user_model
 
+# Fields of a TestRun that are filled in once it has been run.
+RESULT_FIELDS = ["stdout", "stderr", "return_code", "state", "time", "cpu_time", "memory", "test_case_version"]
+
+
+@lru_cache()
+def source_cache() -> DiskCache:
+    return DiskCache(settings.JUDGE_SOURCE_CACHE_DIR, settings.JUDGE_SOURCE_CACHE_SIZE)
+
+
+def get_sources(solution: Solution) -> Dict[str, str]:
+    """Returns the solution's sources from the worker's cache, or fetches them into it."""
+    # The sources of a solution never change, so entries do not need to be invalidated.
+    key = str(solution.uuid)
+    entry = source_cache().open(key)
+    if entry:
+        with entry:
+            return json.load(entry)
+
+    sources = solution.get_sources()
+    source_cache().put(key, lambda path: path.write_text(json.dumps(sources), encoding="utf-8"))
+    return sources
+
+
+def enqueue_solution(id: int, rejudge: bool = False, generation: Optional[int] = None) -> None:
+    """
+    Judges the solution on the queue and with the priority of either sent solutions or rejudges. The solution is only
+    judged while its problem's test cases are still at the given rejudge generation, or the current one if None.
+    """
+    task = validate_solution.apply_async((id, rejudge, generation), **routing(rejudge))
+    Solution.objects.filter(pk=id).update(task_id=task.id)
+
+
+def supersede_older_solutions(solution: Solution) -> None:
+    """
+    Stops judging the user's older solutions of the same problem, as only the newest one is graded. Their queued
+    tasks are revoked, and tasks that have started already stop at the next state change.
+    """
+    older = Solution.objects.filter(
+        Solution.in_flight(), user_id=solution.user_id, problem_id=solution.problem_id, pk__lt=solution.pk
+    )
+    task_ids = [task_id for task_id in older.values_list("task_id", flat=True) if task_id]
+    older.update(state=Solution.State.SUPERSEDED)
+
+    if task_ids:
+        current_app.control.revoke(task_ids)
+
+
+def set_state(solution: Solution, state: int) -> bool:
+    """Returns False instead of updating the state if the solution has been superseded in the meantime."""
+    updated = Solution.objects.filter(pk=solution.pk).exclude(state=Solution.State.SUPERSEDED).update(state=state)
+    solution.state = state if updated else Solution.State.SUPERSEDED
+    return updated > 0
+
+
+def schedule_rejudge(problem_id: int, generation: int) -> None:
+    rejudge_problem.apply_async((problem_id, generation), countdown=settings.JUDGE_REJUDGE_DELAY, **routing(True))
+
+
+def routing(rejudge: bool) -> Dict[str, Any]:
+    if rejudge:
+        return {"queue": settings.JUDGE_REJUDGE_QUEUE, "priority": settings.JUDGE_REJUDGE_PRIORITY}
+
+    return {"queue": settings.JUDGE_QUEUE, "priority": settings.JUDGE_PRIORITY}
+
+
+def is_current(problem_id: int, generation: int) -> bool:
+    return Problem.objects.filter(pk=problem_id, rejudge_generation=generation).exists()
+
 
 @shared_task()
-def validate_solution(id: int):
+def rejudge_problem(problem_id: int, generation: int):
+    # Triggers for the same problem are coalesced: only the rejudge scheduled last runs.
+    if is_current(problem_id, generation):
+        Problem.objects.get(pk=problem_id).run_all_solutions(generation)
+
+
+@shared_task()
+def validate_solution(id: int, rejudge: bool = False, generation: Optional[int] = None):
+    """
+    Compiles the solution and fans its test runs out in batches of JUDGE_RUN_BATCH_SIZE to run_test_runs tasks, which
+    any worker listening on the same queue may pick up. The worker running the last batch finalizes the solution.
+    """
     solution = Solution.objects.get(pk=id)
-    solution.state = Solution.State.COMPILATION_IN_PROGRESS
-    solution.save()
+    if generation is None:
+        generation = solution.problem.rejudge_generation
+    elif not is_current(solution.problem_id, generation):
+        return
+
+    if solution.state == Solution.State.SUPERSEDED or reuse_results(solution):
+        return
+
+    if not set_state(solution, Solution.State.COMPILATION_IN_PROGRESS):
+        return
 
     try:
-        validate(solution)
+        test_run_ids = compile_solution(solution, generation)
     except Exception as e:
-        get_task_logger(__name__).error("An exception was thrown during validation.", e)
+        get_task_logger(__name__).error("An exception was thrown during compilation.", e)
+        # Left in progress, the solution would count towards the user's in-flight solutions for good.
+        set_state(solution, Solution.State.JUDGE_ERROR)
+        return
+
+    if test_run_ids is None:
+        return
+
+    if not test_run_ids:
+        finalize_solution(id)
+        return
+
+    size = settings.JUDGE_RUN_BATCH_SIZE
+    batches = [test_run_ids[i:i + size] for i in range(0, len(test_run_ids), size)]
+    group(run_test_runs.si(id, batch, generation).set(**routing(rejudge)) for batch in batches).delay()
+
+
+def reuse_results(solution: Solution) -> bool:
+    """
+    Copies the compilation outcome and the test runs of current test case versions from an identical solution that has
+    been judged already. Returns whether nothing is left to judge.
+    """
+    identical = solution.find_identical()
+    if identical is None:
+        return False
+
+    if identical.state == Solution.State.COMPILATION_FAILED:
+        set_state(solution, Solution.State.COMPILATION_FAILED)
+        return True
 
+    test_runs = identical.test_runs.filter(
+        test_case__in=solution.missing_test_cases(), test_case_version=F("test_case__version")
+    )
+    TestRun.objects.bulk_create(
+        (
+            TestRun(solution=solution, test_case_id=test_run.test_case_id, **{
+                field: getattr(test_run, field) for field in RESULT_FIELDS
+            })
+            for test_run in test_runs
+        ),
+        ignore_conflicts=True,
+    )
 
-def validate(solution: Solution) -> None:
+    if solution.missing_test_cases().exists():
+        return False
+
+    get_task_logger(__name__).info(f"Reused the results of identical solution {identical.pk}.")
+    set_state(solution, Solution.State.JUDGED)
+    return True
+
+
+def compile_solution(solution: Solution, generation: int) -> Optional[List[int]]:
+    """
+    Returns the ids of the solution's pending test runs, or None if compilation failed, or the test cases have changed
+    or the solution has been superseded since. Test runs are only created for test cases the solution has none for
+    yet. Compiled artifacts are published to S3_ARTIFACT_BUCKET by the runner, so that workers running the test cases
+    do not compile again.
+    """
     log: Logger = get_task_logger(__name__)
     env = Runner.for_language(solution.language)
 
-    log.debug("Compiling")
-    result = env.compile(solution.get_sources())
+    try:
+        log.debug("Compiling")
+        result = env.compile(get_sources(solution))
+    finally:
+        env.clean_up()
+
+    if not is_current(solution.problem_id, generation):
+        log.info("Test cases changed during compilation, the solution will be rejudged.")
+        return None
 
     if result and result.return_code != 0:
         log.info(f"Compilation failed. Process exited with error code {result.return_code}.")
         log.info(f"stdout: {result.stdout.decode('utf-8')}")
         log.info(f"stderr: {result.stderr.decode('utf-8')}")
-        solution.state = Solution.State.COMPILATION_FAILED
-        solution.save()
-    else:
-        solution.state = Solution.State.COMPILATION_SUCCESSFUL
-        solution.save()
-        for test_case in solution.problem.test_cases.all():
-            test_run = TestRun(
-                solution=solution,
-                test_case=test_case,
-            )
-            test_run.save()
-
-        for test_run in solution.test_runs.all():
-            test_case = test_run.test_case
-            log.debug("Running")
-            result = env.run(
-                stdin=test_case.input.encode("utf-8"),
-                memory_limit=test_case.memory_limit,
-                time_limit=test_case.time_limit,
+        set_state(solution, Solution.State.COMPILATION_FAILED)
+        return None
+
+    if not set_state(solution, Solution.State.COMPILATION_SUCCESSFUL):
+        return None
+
+    # Another task judging the same solution, e.g. a rejudge, may be creating the same test runs.
+    TestRun.objects.bulk_create(
+        (
+            TestRun(solution=solution, test_case_id=test_case_id)
+            for test_case_id in solution.missing_test_cases().values_list("pk", flat=True)
+        ),
+        ignore_conflicts=True,
+    )
+
+    # bulk_create() does not set primary keys on every database
+    return list(solution.test_runs.filter(state=TestRun.State.PENDING).order_by("pk").values_list("pk", flat=True))
+
+
+@shared_task()
+def run_test_runs(solution_id: int, test_run_ids: List[int], generation: int):
+    solution = Solution.objects.get(pk=solution_id)
+    if solution.state == Solution.State.SUPERSEDED or not is_current(solution.problem_id, generation):
+        return
+
+    test_runs = list(
+        TestRun.objects.filter(pk__in=test_run_ids, state=TestRun.State.PENDING)
+        .select_related("test_case")
+        .order_by("pk")
+    )
+
+    if test_runs:
+        env = Runner.for_language(solution.language)
+        try:
+            # Restores the artifact published by validate_solution
+            env.compile(get_sources(solution))
+            run_tests(env, test_runs)
+        except Exception as e:
+            get_task_logger(__name__).error("An exception was thrown during validation.", e)
+            # Test runs left pending would keep the solution from ever being finalized. They have no test case version,
+            # so the next rejudge runs them again.
+            TestRun.objects.filter(pk__in=test_run_ids, state=TestRun.State.PENDING).update(
+                state=TestRun.State.JUDGE_ERROR
             )
+        finally:
+            env.clean_up()
+
+    # Every batch checks, so whichever finishes last finalizes the solution, without a chord and a result backend.
+    if not solution.test_runs.filter(state=TestRun.State.PENDING).exists():
+        finalize_solution(solution_id)
+
+
+def finalize_solution(id: int) -> None:
+    Solution.objects.filter(pk=id, state=Solution.State.COMPILATION_SUCCESSFUL).update(state=Solution.State.JUDGED)
+
+
+def run_tests(env: Runner, test_runs: List[TestRun]) -> None:
+    with ThreadPoolExecutor(max_workers=settings.JUDGE_TEST_CONCURRENCY) as executor:
+        results = executor.map(partial(run_test_case, env), (test_run.test_case for test_run in test_runs))
+
+        # map() yields results in submission order, so test runs are stored in test case order
+        judged = []
+        last_flush = monotonic()
+        for test_run, result in zip(test_runs, results):
+            judge_test_run(test_run, result)
+            judged.append(test_run)
+
+            interval = settings.JUDGE_PROGRESS_FLUSH_INTERVAL
+            if interval and monotonic() - last_flush >= interval:
+                TestRun.objects.bulk_update(judged, RESULT_FIELDS)
+                judged = []
+                last_flush = monotonic()
+
+        if judged:
+            TestRun.objects.bulk_update(judged, RESULT_FIELDS)
+
+
+def run_test_case(env: Runner, test_case: TestCase) -> TaskResult:
+    get_task_logger(__name__).debug("Running")
+    # Stored inputs are files in the worker's cache, which are handed to the program without being read here.
+    with test_case.open_input() as stdin, admission.admit(test_case.memory_limit):
+        return env.run(
+            stdin=stdin,
+            memory_limit=test_case.memory_limit,
+            time_limit=test_case.time_limit,
+        )
+
+
+def judge_test_run(test_run: TestRun, result: TaskResult) -> None:
+    log: Logger = get_task_logger(__name__)
+    test_case = test_run.test_case
+
+    # Output may have been cut off in the middle of a character when it exceeded the output limit
+    test_run.stdout = result.stdout.decode("utf-8", errors="replace")
+    test_run.stderr = result.stderr.decode("utf-8", errors="replace")
+    test_run.return_code = result.return_code
+    test_run.time = result.time.total_seconds()
+    test_run.cpu_time = result.cpu_time.total_seconds()
+    test_run.memory = result.max_rss
+    test_run.test_case_version = test_case.version
+
+    if result.memory_limit_exceeded:
+        test_run.state = TestRun.State.MEMORY_LIMIT_EXCEEDED
+    elif result.timed_out:
+        test_run.state = TestRun.State.TIMED_OUT
+    elif result.output_limit_exceeded:
+        test_run.state = TestRun.State.OUTPUT_LIMIT_EXCEEDED
+    elif result.return_code != 0:
+        log.info(f"Program exited with error code {result.return_code}.")
+        log.info(f"stdout: {result.stdout}")
+        test_run.state = TestRun.State.CRASHED
+    else:
+        log.debug("Validating")
+        check = checkers.for_test_case(test_case)
+        with test_case.open_expected_output() as expected_output:
+            valid = check(BytesIO(result.stdout), expected_output)
 
-            test_run.stdout = result.stdout.decode("utf-8")
-            test_run.stderr = result.stderr.decode("utf-8")
-            test_run.return_code = result.return_code
-            test_run.time = result.time.total_seconds()
-
-            if result.timed_out:
-                test_run.state = TestRun.State.TIMED_OUT
-            elif result.return_code != 0:
-                log.info(f"Program exited with error code {result.return_code}.")
-                log.info(f"stdout: {result.stdout}")
-                test_run.state = TestRun.State.CRASHED
-            else:
-                log.debug("Validating")
-                if test_run.stdout.strip() == test_case.expected_output.strip():
-                    test_run.state = TestRun.State.VALID
-                else:
-                    test_run.state = TestRun.State.INVALID
-
-            test_run.save()
-
-    env.clean_up()
\ No newline at end of file
+        test_run.state = TestRun.State.VALID if valid else TestRun.State.INVALID
@@ -0,0 +1,52 @@
+"""
+Storage of test case inputs and expected outputs. Small ones are kept inline in the database. Larger ones are stored
+once in S3 under their SHA-256 hash, and only the hash and size are kept in the TestCase row. Workers keep a local
+cache of the blobs keyed by hash, so each one is downloaded once per worker rather than once per submission.
+"""
+from functools import lru_cache
+from hashlib import sha256
+from io import BytesIO
+from typing import BinaryIO, Tuple
+
+from django.conf import settings
+
+from .cache import DiskCache
+from .storage import put_object, object_exists, download_object
+
+
+@lru_cache()
+def cache() -> DiskCache:
+    return DiskCache(settings.JUDGE_TESTDATA_CACHE_DIR, settings.JUDGE_TESTDATA_CACHE_SIZE)
+
+
+def store(text: str) -> Tuple[str, str, int]:
+    """Returns the text to keep inline (empty if it was uploaded instead), its hash and its size in bytes."""
+    data = text.encode("utf-8")
+    digest = sha256(data).hexdigest()
+
+    if len(data) <= settings.JUDGE_TESTDATA_INLINE_LIMIT:
+        return text, digest, len(data)
+
+    if not object_exists(settings.S3_TESTDATA_BUCKET, digest):
+        put_object(settings.S3_TESTDATA_BUCKET, digest, data)
+
+    return "", digest, len(data)
+
+
+def is_stored(inline: str, size: int) -> bool:
+    return not inline and size > 0
+
+
+def open_data(inline: str, digest: str, size: int) -> BinaryIO:
+    if not is_stored(inline, size):
+        return BytesIO(inline.encode("utf-8"))
+
+    entry = cache().open(digest)
+    if entry is None:
+        cache().put(digest, lambda path: download_object(settings.S3_TESTDATA_BUCKET, digest, path))
+        entry = cache().open(digest)
+
+    if entry is None:
+        raise RuntimeError(f"Test data {digest} of {size} bytes does not fit in the cache.")
+
+    return entry
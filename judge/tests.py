@@ -1,3 +1,244 @@
-from django.test import TestCase
+import os
+import time
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
+from uuid import uuid4
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from judge import checkers, storage
+from judge.models import TestCase
+
+
+class StorageConformance:
+    """Tests every storage backend has to pass, through the functions of judge.storage."""
+    backend_path: str
+    bucket: str
+
+    def setUp(self):
+        storage.backend.cache_clear()
+        self.addCleanup(storage.backend.cache_clear)
+        backend = override_settings(STORAGE_BACKEND=self.backend_path)
+        backend.enable()
+        self.addCleanup(backend.disable)
+        storage.backend().ensure_bucket(self.bucket)
+        # Objects of every test are kept apart, as buckets of remote backends are shared
+        self.prefix = f"{uuid4().hex}/"
+
+    def test_put_and_get(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", "zażółć".encode("utf-8"))
+
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}a"), "zażółć".encode("utf-8"))
+        self.assertEqual(storage.get_object(self.bucket, f"{self.prefix}a"), "zażółć")
+
+    def test_put_replaces(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1")
+        storage.put_object(self.bucket, f"{self.prefix}a", b"2")
+
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}a"), b"2")
+
+    def test_empty_object(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"")
+
+        self.assertTrue(storage.object_exists(self.bucket, f"{self.prefix}a"))
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}a"), b"")
+
+    def test_object_age(self):
+        self.assertIsNone(storage.object_age(self.bucket, f"{self.prefix}a"))
+        self.assertFalse(storage.object_exists(self.bucket, f"{self.prefix}a"))
+
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1")
+
+        # Remote clocks and timestamps with a resolution of seconds allow for some difference
+        self.assertLess(abs(storage.object_age(self.bucket, f"{self.prefix}a")), 60)
+        self.assertTrue(storage.object_exists(self.bucket, f"{self.prefix}a"))
+
+    def test_get_objects(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1")
+        storage.put_object(self.bucket, f"{self.prefix}b", b"2")
+
+        self.assertEqual(
+            storage.get_objects(self.bucket, [f"{self.prefix}a", f"{self.prefix}b"]),
+            {f"{self.prefix}a": b"1", f"{self.prefix}b": b"2"},
+        )
+
+    def test_get_directories(self):
+        storage.put_object(self.bucket, f"{self.prefix}x/files/a.py", b"1")
+        storage.put_object(self.bucket, f"{self.prefix}x/files/b.py", b"2")
+        storage.put_object(self.bucket, f"{self.prefix}x/files/nested/c.py", b"3")
+        storage.put_object(self.bucket, f"{self.prefix}x/other", b"4")
+        storage.put_object(self.bucket, f"{self.prefix}y/files/a.py", b"5")
+
+        directories = storage.get_directories(
+            self.bucket, [f"{self.prefix}x/files/", f"{self.prefix}y/files/", f"{self.prefix}z/files/"]
+        )
+
+        self.assertEqual(directories, {
+            f"{self.prefix}x/files/": {"a.py": "1", "b.py": "2"},
+            f"{self.prefix}y/files/": {"a.py": "5"},
+            f"{self.prefix}z/files/": {},
+        })
+        self.assertEqual(storage.get_directory(self.bucket, f"{self.prefix}y/files/"), {"a.py": "5"})
+
+    def test_list_objects_older_than(self):
+        storage.put_object(self.bucket, f"{self.prefix}blobs/a", b"1")
+        storage.put_object(self.bucket, f"{self.prefix}blobs/nested/b", b"2")
+
+        self.assertEqual(storage.list_objects_older_than(self.bucket, f"{self.prefix}blobs/", 3600), [])
+        self.assertEqual(
+            sorted(storage.list_objects_older_than(self.bucket, f"{self.prefix}blobs/", -3600)),
+            [f"{self.prefix}blobs/a", f"{self.prefix}blobs/nested/b"],
+        )
+
+    def test_put_objects_once(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"old")
+
+        storage.put_objects_once(self.bucket, {f"{self.prefix}a": b"new", f"{self.prefix}b": b"new"}, 3600)
+
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}a"), b"old")
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}b"), b"new")
+
+        storage.put_objects_once(self.bucket, {f"{self.prefix}a": b"new"}, -3600)
+
+        self.assertEqual(storage.get_bytes(self.bucket, f"{self.prefix}a"), b"new")
+
+    def test_remove_objects(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1")
+        storage.put_object(self.bucket, f"{self.prefix}b", b"2")
+
+        storage.remove_objects(self.bucket, [f"{self.prefix}a", f"{self.prefix}missing"])
+
+        self.assertFalse(storage.object_exists(self.bucket, f"{self.prefix}a"))
+        self.assertTrue(storage.object_exists(self.bucket, f"{self.prefix}b"))
+
+    def test_download_object(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1" * 3 * 1024 * 1024)
+
+        with TemporaryDirectory() as directory:
+            path = Path(directory, "a")
+            storage.download_object(self.bucket, f"{self.prefix}a", path)
+
+            self.assertEqual(path.read_bytes(), b"1" * 3 * 1024 * 1024)
+
+    def test_local_path(self):
+        storage.put_object(self.bucket, f"{self.prefix}a", b"1")
+
+        path = storage.local_path(self.bucket, f"{self.prefix}a")
+
+        if path is not None:
+            self.assertEqual(path.read_bytes(), b"1")
+        self.assertIsNone(storage.local_path(self.bucket, f"{self.prefix}missing"))
+
+
+class FileSystemStorageTests(StorageConformance, SimpleTestCase):
+    backend_path = "judge.storage.FileSystemStorage"
+    bucket = "test"
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = override_settings(FILE_STORAGE_ROOT=directory.name)
+        root.enable()
+        self.addCleanup(root.disable)
+        super().setUp()
+
+    def test_local_path_is_served(self):
+        storage.put_object(self.bucket, "a", b"1")
+
+        self.assertEqual(storage.local_path(self.bucket, "a").read_bytes(), b"1")
+
+    def test_rejects_names_outside_bucket(self):
+        for name in ("../a", "a/../../b", "a//b", "."):
+            with self.assertRaises(ValueError):
+                storage.put_object(self.bucket, name, b"1")
+
+    def test_put_leaves_no_temporary_files(self):
+        storage.put_object(self.bucket, "a", b"1")
+
+        self.assertEqual(os.listdir(Path(storage.backend().root, self.bucket)), ["a"])
+
+    def test_object_age_follows_modification(self):
+        storage.put_object(self.bucket, "a", b"1")
+        path = storage.local_path(self.bucket, "a")
+        os.utime(path, (time.time() - 100, time.time() - 100))
+
+        self.assertGreaterEqual(storage.object_age(self.bucket, "a"), 100)
+        self.assertEqual(storage.list_objects_older_than(self.bucket, "", 50), ["a"])
+
+
+@skipUnless(
+    os.environ.get("STORAGE_TEST_MINIO") == "1", "Set STORAGE_TEST_MINIO=1 to test against the S3_HOST service."
+)
+class MinioStorageTests(StorageConformance, SimpleTestCase):
+    backend_path = "judge.storage.MinioStorage"
+    bucket = "storage-tests"
+
+
+class CheckerTests(SimpleTestCase):
+    def check(self, checker: checkers.Checker, output: bytes, expected: bytes) -> bool:
+        return checker(BytesIO(output), BytesIO(expected))
+
+    def assertCheckers(self, output: bytes, expected: bytes, **results: bool):
+        """Checks output against expected with each named checker, in both directions and in tiny chunks."""
+        all_checkers = {
+            "exact": checkers.exact,
+            "tokens": checkers.tokens,
+            "lines": checkers.lines,
+            "floats": partial(checkers.floats, tolerance=1e-6),
+        }
+        for name, result in results.items():
+            for chunk_size in (64 * 1024, 1, 2, 3):
+                with self.subTest(checker=name, chunk_size=chunk_size):
+                    with patch.object(checkers, "_CHUNK_SIZE", chunk_size):
+                        self.assertEqual(self.check(all_checkers[name], output, expected), result)
+                        self.assertEqual(self.check(all_checkers[name], expected, output), result)
+
+    def test_identical(self):
+        self.assertCheckers(b"1 2\n3\n", b"1 2\n3\n", exact=True, tokens=True, lines=True, floats=True)
+
+    def test_empty(self):
+        self.assertCheckers(b"", b"", exact=True, tokens=True, lines=True, floats=True)
+        self.assertCheckers(b" \n\n", b"", exact=True, tokens=True, lines=True, floats=True)
+        self.assertCheckers(b"1", b"", exact=False, tokens=False, lines=False, floats=False)
+
+    def test_leading_and_trailing_whitespace(self):
+        self.assertCheckers(b"\n1\n", b"1", exact=True, tokens=True, lines=True, floats=True)
+        self.assertCheckers(b" \n\t\n1 2\n\n \n", b"1 2", exact=True, tokens=True, lines=True, floats=True)
+        self.assertCheckers(b"1 2  ", b"1 2\n", exact=True, tokens=True, lines=True, floats=True)
+
+    def test_whitespace_within_lines(self):
+        self.assertCheckers(b"1  2\t3\n", b"1 2 3\n", exact=False, tokens=True, lines=True, floats=True)
+
+    def test_line_breaks(self):
+        self.assertCheckers(b"1\n2\n", b"1 2\n", exact=False, tokens=True, lines=False, floats=True)
+        self.assertCheckers(b"1\n\n2\n", b"1\n2\n", exact=False, tokens=True, lines=False, floats=True)
+        self.assertCheckers(b"1\r\n2\r\n", b"1\n2\n", exact=False, tokens=True, lines=True, floats=True)
+
+    def test_different_tokens(self):
+        self.assertCheckers(b"1 2 3", b"1 2 4", exact=False, tokens=False, lines=False, floats=False)
+        self.assertCheckers(b"12", b"1 2", exact=False, tokens=False, lines=False, floats=False)
+        self.assertCheckers(b"1 2", b"1 2 3", exact=False, tokens=False, lines=False, floats=False)
+        self.assertCheckers(b"abc", b"abd", exact=False, tokens=False, lines=False, floats=False)
+
+    def test_tokens_across_chunks(self):
+        self.assertCheckers(b"abc def", b"abcdef", tokens=False, floats=False)
+        self.assertCheckers(b"abcdef ghi", b"abcdef  ghi", tokens=True, floats=True)
+
+    def test_floats(self):
+        floats = partial(checkers.floats, tolerance=1e-3)
+
+        self.assertTrue(self.check(floats, b"1.0001 2", b"1 2.0"))
+        self.assertTrue(self.check(floats, b"1000100", b"1000000"))
+        self.assertFalse(self.check(floats, b"1.01", b"1"))
+        self.assertFalse(self.check(floats, b"1 a", b"1 b"))
+        self.assertFalse(self.check(floats, b"1", b"1 1"))
+
+    def test_for_test_case(self):
+        self.assertIs(checkers.for_test_case(TestCase(checker=TestCase.Checker.EXACT)), checkers.exact)
+        self.assertIs(checkers.for_test_case(TestCase(checker=TestCase.Checker.WHITESPACE)), checkers.lines)
+        floats = checkers.for_test_case(TestCase(checker=TestCase.Checker.FLOAT, tolerance=0.5))
+        self.assertTrue(self.check(floats, b"1.4", b"1"))
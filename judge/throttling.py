@@ -0,0 +1,74 @@
+"""
+Limits on sending solutions, checked before a solution is stored and enqueued. Each check returns None if the solution
+may be sent, or the number of seconds after which the user should try again.
+"""
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from SZTOS.celery import app
+from .models import Problem, Solution
+
+_RATE_WINDOW = timedelta(minutes=1)
+
+
+def retry_after(user: User, problem: Problem) -> Optional[int]:
+    return user_rate_retry_after(user) or user_active_retry_after(user, problem) or queue_retry_after()
+
+
+def user_rate_retry_after(user: User) -> Optional[int]:
+    limit = settings.JUDGE_USER_SOLUTIONS_PER_MINUTE
+    if not limit:
+        return None
+
+    recent = Solution.objects.filter(user=user, pub_date__gt=timezone.now() - _RATE_WINDOW).order_by("-pub_date")
+    pub_dates = list(recent.values_list("pub_date", flat=True)[:limit])
+    if len(pub_dates) < limit:
+        return None
+
+    # The oldest of the last `limit` solutions has to leave the window first.
+    return max(1, int((pub_dates[-1] + _RATE_WINDOW - timezone.now()).total_seconds()) + 1)
+
+
+def user_active_retry_after(user: User, problem: Problem) -> Optional[int]:
+    limit = settings.JUDGE_USER_ACTIVE_SOLUTIONS
+    if not limit:
+        return None
+
+    # Active solutions of the same problem are superseded by the new one, so they do not count.
+    active = Solution.objects.filter(Solution.in_flight(), user=user).exclude(problem=problem)
+    if active.count() < limit:
+        return None
+
+    return settings.JUDGE_QUEUE_RETRY_AFTER
+
+
+def queue_retry_after() -> Optional[int]:
+    limit = settings.JUDGE_QUEUE_DEPTH_LIMIT
+    if not limit:
+        return None
+
+    depth = cache.get("judge:queue_depth")
+    if depth is None:
+        depth = queue_depth(settings.JUDGE_QUEUE)
+        cache.set("judge:queue_depth", depth, settings.JUDGE_QUEUE_DEPTH_CACHE_TIME)
+
+    if depth < limit:
+        return None
+
+    return settings.JUDGE_QUEUE_RETRY_AFTER
+
+
+def queue_depth(queue: str) -> int:
+    """Returns the number of messages waiting in the queue, or 0 if the broker cannot tell."""
+    with app.connection_for_read() as connection:
+        try:
+            _, messages, _ = connection.default_channel.queue_declare(queue, passive=True)
+            return messages
+        except (OperationalError, *connection.connection_errors, *connection.channel_errors):
+            return 0
@@ -1,10 +1,13 @@
 import csv
-from io import BytesIO, StringIO
-from zipfile import ZipFile, ZIP_DEFLATED
+from io import StringIO
+from typing import Iterator, Tuple
 
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpResponse, Http404
+from django.db.models.functions import Substr
+from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpResponse, Http404, StreamingHttpResponse, \
+    FileResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
@@ -12,10 +15,11 @@ from django.views import generic
 from django.views.decorators.http import require_POST, require_GET
 from django.views.generic.edit import FormMixin
 
+from . import archive, throttling
 from .forms import SendSolutionForm, ProblemForm, TestCaseForm, CourseCreateUpdateForm, StudentForm, \
     CourseAddStudentsForm
 from .models import Course, Problem, Solution, TestCase
-from .tasks import validate_solution
+from .tasks import enqueue_solution, supersede_older_solutions
 
 
 class IndexView(generic.TemplateView):
@@ -285,7 +289,13 @@ class TestCaseView(generic.ListView):
     context_object_name = 'test_cases_list'
 
     def get_queryset(self):
-        return TestCase.objects.filter(problem__id=self.kwargs.get('problem_pk'))
+        # Only a preview of the test data is shown, so the full inputs and outputs are not loaded.
+        return TestCase.objects.filter(problem__id=self.kwargs.get('problem_pk')).defer(
+            'input', 'expected_output'
+        ).annotate(
+            input_preview=Substr('input', 1, 101),
+            expected_output_preview=Substr('expected_output', 1, 101),
+        )
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data()
@@ -308,7 +318,7 @@ class TestCaseCreate(generic.CreateView):
     def get_success_url(self):
         course = get_object_or_404(Course, id=self.kwargs.get('course_pk'))
         problem = get_object_or_404(Problem, id=self.kwargs.get('problem_pk'))
-        problem.run_all_solutions()
+        problem.schedule_rejudge()
         return reverse('judge:test_cases', args=[course.id, problem.id])
 
     def get_context_data(self, *, object_list=None, **kwargs):
@@ -333,7 +343,7 @@ class TestCaseUpdate(generic.UpdateView):
     def get_success_url(self):
         course = get_object_or_404(Course, id=self.kwargs.get('course_pk'))
         problem = get_object_or_404(Problem, id=self.kwargs.get('problem_pk'))
-        problem.run_all_solutions()
+        problem.schedule_rejudge()
         return reverse('judge:test_cases', args=[course.id, problem.id])
 
     def get_context_data(self, *, object_list=None, **kwargs):
@@ -353,7 +363,7 @@ class TestCaseDelete(generic.DeleteView):
     def get_success_url(self):
         course = get_object_or_404(Course, id=self.kwargs.get('course_pk'))
         problem = get_object_or_404(Problem, id=self.kwargs.get('problem_pk'))
-        problem.run_all_solutions()
+        problem.schedule_rejudge()
         return reverse('judge:test_cases', args=[course.id, problem.id])
 
     def get_context_data(self, *, object_list=None, **kwargs):
@@ -379,13 +389,20 @@ def send_solution(request, course_pk, problem_pk) -> HttpResponse:
     if not form.is_valid():
         return HttpResponseBadRequest("Incorrect form data.")
 
+    retry_after = throttling.retry_after(request.user, problem)
+    if retry_after:
+        response = HttpResponse(f"Too many solutions sent, try again in {retry_after} seconds.", status=429)
+        response["Retry-After"] = str(retry_after)
+        return response
+
     solution = Solution(problem=problem, user=request.user, language=form.cleaned_data["language"])
 
-    for file in request.FILES.getlist("sources"):
-        solution.save_file(file)
+    solution.hash_files(request.FILES.getlist("sources"))
+    solution.save_files(request.FILES.getlist("sources"))
 
     solution.save()
-    validate_solution.delay(solution.id)
+    supersede_older_solutions(solution)
+    enqueue_solution(solution.id)
     return HttpResponseRedirect(reverse('judge:detail', args=(problem.course.id, problem.id,)))
 
 
@@ -402,13 +419,16 @@ def download_solution(request, course_pk, problem_pk, solution_pk):
     if solution.user != request.user and not request.user.has_perm("judge.view_all_solutions"):
         raise Http404()
 
-    data = BytesIO()
-    with ZipFile(data, "w", ZIP_DEFLATED) as archive:
-        sources = solution.get_sources().items()
-        for path, content in sources:
-            archive.writestr(path, content)
+    # Archived sources are served as stored, local files with sendfile() where the server supports it
+    path = solution.get_archive_path()
+    if path is not None:
+        return FileResponse(path.open("rb"), content_type="application/zip")
+
+    data = solution.get_archive()
+    if data is not None:
+        return HttpResponse(data, content_type="application/zip")
 
-    return HttpResponse(data.getvalue(), content_type="application/zip")
+    return StreamingHttpResponse(archive.stream(solution.get_sources().items()), content_type="application/zip")
 
 
 @require_GET
@@ -449,15 +469,18 @@ def course_grades_csv(request, course_pk):
 @permission_required('judge.view_all_solutions')
 def download_all_solutions(request, course_pk, problem_pk):
     problem = get_object_or_404(Problem, pk=problem_pk, course__pk=course_pk)
-
-    data = BytesIO()
-    with ZipFile(data, "w", ZIP_DEFLATED) as archive:
-        for user, solution in problem.get_solutions().items():
-            sources = solution.get_sources().items()
-            for path, content in sources:
-                archive.writestr(f"{user.username}/{path}", content)
-
-    return HttpResponse(data.getvalue(), content_type="application/zip")
+    solutions = list(problem.get_solutions().items())
+
+    def entries() -> Iterator[Tuple[str, str]]:
+        # Sources are fetched concurrently, a window of solutions at a time, to bound memory use
+        window = settings.S3_MAX_POOL_CONNECTIONS
+        for start in range(0, len(solutions), window):
+            sources = Solution.get_sources_of([solution for _, solution in solutions[start:start + window]])
+            for user, solution in solutions[start:start + window]:
+                for path, content in sources[solution].items():
+                    yield f"{user.username}/{path}", content
+
+    return StreamingHttpResponse(archive.stream(entries()), content_type="application/zip")
 
 
 @require_POST